@@ -1,14 +1,46 @@
 from django.contrib import admin
+from django.contrib.admin.views.main import ChangeList
 
-from .models import Comment, Follow, Group, Post
+from .models import Comment, Follow, Group, Post, Task
+from .paginators import EstimatedCountPaginator
 
 
-class PostAdmin(admin.ModelAdmin):
+class DeferringChangeList(ChangeList):
+    """Leaves the model admin's ``list_defer`` columns (whole post texts)
+    out of the changelist query.
+    """
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).defer(
+            *self.model_admin.list_defer)
+
+
+class DeferringAdmin(admin.ModelAdmin):
+    list_defer = ()
+
+    def get_changelist(self, request, **kwargs):
+        return DeferringChangeList
+
+
+class PostAdmin(DeferringAdmin):
     list_display = ("pk", "text", "pub_date", "author", "group")
+    # rows show the stored excerpt, the text itself is not loaded
+    list_defer = ("text",)
+    list_select_related = ("author", "group")
     search_fields = ("text",)
+    # "today", "past 7 days", ... are range lookups on the post_pub_date
+    # index; no date_hierarchy: its list of years and months is a SELECT
+    # DISTINCT over every row, sorted in a temporary B-tree
     list_filter = ("pub_date",)
+    raw_id_fields = ("author",)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     empty_value_display = "-пусто-"
 
+    def get_list_display(self, request):
+        return ["excerpt" if name == "text" else name
+                for name in self.list_display]
+
 
 class GroupAdmin(admin.ModelAdmin):
     list_display = ("pk", "title", "slug", "description")
@@ -16,14 +48,34 @@ class GroupAdmin(admin.ModelAdmin):
     empty_value_display = "-пусто-"
 
 
-class CommentAdmin(admin.ModelAdmin):
+class CommentAdmin(DeferringAdmin):
     list_display = ("pk", "post", "text", "created")
+    list_select_related = ("post",)
+    # the post column is Post.__str__, i.e. its excerpt
+    list_defer = ("post__text",)
     search_fields = ("text",)
+    # no date_hierarchy, as in PostAdmin
+    raw_id_fields = ("post", "author")
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     empty_value_display = "-пусто-"
 
 
 class FollowAdmin(admin.ModelAdmin):
     list_display = ("user", "author")
+    list_select_related = ("user", "author")
+    raw_id_fields = ("user", "author")
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    empty_value_display = "-пусто-"
+
+
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ("pk", "name", "status", "attempts", "run_after",
+                    "created")
+    list_filter = ("status", "name")
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     empty_value_display = "-пусто-"
 
 
@@ -31,3 +83,4 @@ admin.site.register(Post, PostAdmin)
 admin.site.register(Group, GroupAdmin)
 admin.site.register(Comment, CommentAdmin)
 admin.site.register(Follow, FollowAdmin)
+admin.site.register(Task, TaskAdmin)
@@ -0,0 +1,127 @@
+"""Latency and query counts of the feed views on the current database.
+
+Each view is requested through the test client with URLs sampled from the
+data (random groups, authors, posts and followers), so the numbers follow
+whatever ``manage.py generate_data`` (posts/synthetic.py) or a real import
+put in the database. With ``warm=False`` the cache is cleared before every
+request and the database path is measured.
+"""
+import random
+import subprocess
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Max, Min
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import Group, Post, User, UserStats
+
+VIEWS = ('index', 'group_posts', 'profile', 'post_view', 'follow_index')
+
+
+def percentile(samples, share):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * share))]
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+class Sampler:
+    """Random request targets; posts are picked by id, not ORDER BY
+    RANDOM(), which would scan the whole table every time.
+    """
+
+    def __init__(self, rng):
+        self.rng = rng
+        bounds = Post.objects.aggregate(low=Min('id'), high=Max('id'))
+        self.low, self.high = bounds['low'], bounds['high']
+        self.slugs = list(Group.objects.values_list('slug', flat=True))
+        self.followers = list(UserStats.objects.filter(
+            following_count__gt=0).values_list('user_id', flat=True)[:1000])
+        self.pages = max(1, min(10, Post.objects.count() // 10))
+
+    def post(self):
+        return Post.objects.filter(
+            id__gte=self.rng.randint(self.low, self.high)).select_related(
+            'author').order_by('id').first()
+
+    def request(self, view):
+        """``(url, user)`` for one request to ``view``; user may be None."""
+        if view == 'index':
+            return (f"{reverse('index')}?page="
+                    f"{self.rng.randint(1, self.pages)}", None)
+        if view == 'group_posts':
+            return reverse('group_posts',
+                           args=[self.rng.choice(self.slugs)]), None
+        if view == 'follow_index':
+            return reverse('follow_index'), User.objects.get(
+                id=self.rng.choice(self.followers))
+        post = self.post()
+        if view == 'profile':
+            return reverse('profile', args=[post.author.username]), None
+        return reverse('post', args=[post.author.username, post.id]), None
+
+    def available(self, view):
+        return {'group_posts': self.slugs,
+                'follow_index': self.followers}.get(view, self.low)
+
+
+def measure(url, client, warm):
+    if warm:
+        client.get(url)
+    else:
+        cache.clear()
+    with CaptureQueriesContext(connection) as queries:
+        started = time.perf_counter()
+        response = client.get(url)
+        elapsed = (time.perf_counter() - started) * 1000
+    if response.status_code != 200:
+        raise RuntimeError(f'{url}: {response.status_code}')
+    return elapsed, len(queries)
+
+
+def run(requests=50, warm=False, views=VIEWS, seed=0):
+    """Benchmark ``views``; returns a JSON-serialisable dict."""
+    sampler = Sampler(random.Random(seed))
+    results = {}
+    for view in views:
+        if not sampler.available(view):
+            continue
+        timings, query_counts = [], []
+        for _ in range(requests):
+            url, user = sampler.request(view)
+            client = Client()
+            if user is not None:
+                client.force_login(user)
+            elapsed, query_count = measure(url, client, warm)
+            timings.append(elapsed)
+            query_counts.append(query_count)
+        results[view] = {
+            'requests': requests,
+            'mean_ms': round(sum(timings) / len(timings), 2),
+            'p50_ms': round(percentile(timings, .5), 2),
+            'p95_ms': round(percentile(timings, .95), 2),
+            'p99_ms': round(percentile(timings, .99), 2),
+            'queries': max(query_counts),
+        }
+    return {
+        'commit': git_commit(),
+        'created': timezone.now().isoformat(),
+        'database': connection.vendor,
+        'posts': Post.objects.count(),
+        'users': User.objects.count(),
+        'warm': warm,
+        'views': results,
+    }
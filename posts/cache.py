@@ -0,0 +1,88 @@
+import hashlib
+from functools import wraps
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Group
+
+GENERATION_KEY = 'generation:{}'
+PAGE_KEY = 'page:{}:{}:{}'
+# Every cached page depends on this scope as well; bumped by rare,
+# site-wide changes (e.g. a group is renamed).
+SITE_SCOPE = 'site'
+
+
+def new_generation():
+    # random rather than a counter: a counter restarted after its key was
+    # evicted would bring back pages cached under its old values
+    return uuid4().hex
+
+
+def get_generations(scopes):
+    keys = [GENERATION_KEY.format(scope) for scope in scopes]
+    found = cache.get_many(keys)
+    missing = {key: new_generation() for key in keys if key not in found}
+    if missing:
+        cache.set_many(missing, None)
+        found.update(missing)
+    return [found[key] for key in keys]
+
+
+def bump(*scopes):
+    """Invalidate everything cached under ``scopes``: their keys embed the
+    generation, so old entries are simply never read again and age out
+    of the cache on their own.
+    """
+    cache.set_many({GENERATION_KEY.format(scope): new_generation()
+                    for scope in scopes}, None)
+
+
+def bump_post_pages(post):
+    group_ids = {post.group_id, getattr(post, '_initial_group_id', None)}
+    group_slugs = Group.objects.filter(
+        id__in=group_ids - {None}).values_list('slug', flat=True)
+    bump('index_page', f'post:{post.id}',
+         f'profile:{post.author.username}',
+         *(f'group:{slug}' for slug in group_slugs))
+
+
+def cache_page_until_changed(*scopes, per_user=False, timeout=None):
+    """Cache the rendered page per URL (including ?page=) until one of
+    ``scopes`` is bumped. Scopes are formatted with the view kwargs, e.g.
+    ``'profile:{username}'``.
+
+    Anonymous visitors share one copy of the page. Authenticated users get
+    a private copy with ``per_user=True``; otherwise their page is rendered
+    with the viewer-specific parts (follow button, edit links, comment
+    form) around the shared post card fragments.
+
+    Unlike ``cache_page`` no Expires/max-age headers are added: the server
+    copy is invalidated on writes, browsers must not keep it for the TTL.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            if request.user.is_authenticated:
+                if not per_user:
+                    return view(request, *args, **kwargs)
+                viewer = request.user.pk
+            else:
+                viewer = 'anonymous'
+            names = [SITE_SCOPE] + [scope.format(**kwargs)
+                                    for scope in scopes]
+            generations = '.'.join(map(str, get_generations(names)))
+            path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+            key = PAGE_KEY.format(generations, viewer, path)
+            response = cache.get(key)
+            if response is None:
+                response = view(request, *args, **kwargs)
+                if response.status_code == 200 and not response.streaming:
+                    cache.set(key, response,
+                              timeout or settings.PAGE_CACHE_TIMEOUT)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,6 @@
+from .follows import followed_authors as load_followed_authors
+
+
+def followed_authors(request):
+    """``{% if author in followed_authors %}`` in any template."""
+    return {'followed_authors': load_followed_authors(request)}
@@ -0,0 +1,66 @@
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from .models import Comment, Follow, Post, User, UserStats
+
+
+def _change(queryset, field, delta):
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    return queryset.update(**{field: F(field) + delta})
+
+
+def change_user_stats(user_id, field, delta):
+    updated = _change(UserStats.objects.filter(user_id=user_id), field, delta)
+    if not updated and delta > 0:
+        # no stats row yet: recount it from scratch
+        reconcile_user_stats(User.objects.filter(id=user_id))
+
+
+def change_comment_count(post_id, delta):
+    _change(Post.objects.filter(id=post_id), 'comment_count', delta)
+
+
+def _count(queryset, field):
+    subquery = (queryset.filter(**{field: OuterRef('pk')}).order_by()
+                .values(field).annotate(total=Count('pk')).values('total'))
+    return Coalesce(Subquery(subquery), Value(0))
+
+
+def reconcile_user_stats(users=None):
+    """Recount UserStats rows that drifted; returns how many were fixed."""
+    users = User.objects.all() if users is None else users
+    UserStats.objects.bulk_create(
+        (UserStats(user_id=user_id)
+         for user_id in users.values_list('id', flat=True).iterator()),
+        batch_size=500, ignore_conflicts=True)
+    actual = users.annotate(
+        actual_followers=_count(Follow.objects, 'author'),
+        actual_following=_count(Follow.objects, 'user'),
+        actual_posts=_count(Post.objects, 'author'),
+    ).exclude(
+        stats__followers_count=F('actual_followers'),
+        stats__following_count=F('actual_following'),
+        stats__posts_count=F('actual_posts'),
+    ).values_list('id', 'actual_followers', 'actual_following',
+                  'actual_posts')
+    fixed = [
+        UserStats(user_id=user_id, followers_count=followers,
+                  following_count=following, posts_count=posts)
+        for user_id, followers, following, posts in actual
+    ]
+    UserStats.objects.bulk_update(
+        fixed, ['followers_count', 'following_count', 'posts_count'],
+        batch_size=500)
+    return len(fixed)
+
+
+def reconcile_comment_counts():
+    """Recount Post.comment_count where it drifted; returns rows fixed."""
+    drifted = Post.objects.annotate(
+        actual=_count(Comment.objects, 'post')
+    ).exclude(comment_count=F('actual')).values_list('id', 'actual')
+    fixed = [Post(id=post_id, comment_count=count)
+             for post_id, count in drifted]
+    Post.objects.bulk_update(fixed, ['comment_count'], batch_size=500)
+    return len(fixed)
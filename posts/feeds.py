@@ -0,0 +1,124 @@
+from itertools import islice
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import F, IntegerField, Q, Value
+
+from .models import Follow, Post, TimelineEntry, UserStats
+
+PULL_AUTHORS_KEY = 'feed:pull_authors:{}'
+PULL_AUTHORS_TIMEOUT = 300
+BATCH_SIZE = 500
+
+# Follow feeds are ordered by the timeline row, so the page is read straight
+# off the (user, pub_date) index instead of being sorted after a join.
+FEED_ORDERING = ('-feed_date', '-feed_entry')
+
+
+def is_pull_author(author_id):
+    """Authors with too many followers are not fanned out on write;
+    their posts are merged into follower feeds at read time instead.
+    """
+    return UserStats.objects.filter(
+        user_id=author_id,
+        followers_count__gt=settings.FEED_FANOUT_MAX_FOLLOWERS).exists()
+
+
+def _bulk_insert(entries):
+    TimelineEntry.objects.bulk_create(entries, batch_size=BATCH_SIZE,
+                                      ignore_conflicts=True)
+
+
+def _insert_select(columns, queryset):
+    """Copy the rows of ``queryset`` into the timeline with one
+    INSERT ... SELECT, skipping entries that exist. No model instances are
+    built, which is most of the cost of bulk_create for a backfill.
+    """
+    select, params = queryset.query.sql_with_params()
+    ops = connection.ops
+    sql = (f'{ops.insert_statement(ignore_conflicts=True)} '
+           f'{ops.quote_name(TimelineEntry._meta.db_table)} '
+           f'({", ".join(map(ops.quote_name, columns))}) {select} '
+           f'{ops.ignore_conflicts_suffix_sql(ignore_conflicts=True)}')
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def fan_out_post(post):
+    if is_pull_author(post.author_id):
+        return
+    followers = Follow.objects.filter(
+        author_id=post.author_id).values_list('user_id', flat=True)
+    _bulk_insert(
+        TimelineEntry(user_id=user_id, post=post, author_id=post.author_id,
+                      pub_date=post.pub_date)
+        for user_id in followers.iterator()
+    )
+
+
+def add_follow(user_id, author_id):
+    cache.delete(PULL_AUTHORS_KEY.format(user_id))
+    if is_pull_author(author_id):
+        return
+    # model fields are selected before annotations, whatever the order
+    # given to values_list()
+    posts = Post.objects.filter(author_id=author_id).annotate(
+        follower=Value(user_id, IntegerField())).values_list(
+        'id', 'author_id', 'pub_date',
+        'follower')[:settings.FEED_BACKFILL_POSTS]
+    _insert_select(['post_id', 'author_id', 'pub_date', 'user_id'], posts)
+
+
+def remove_follow(user_id, author_id):
+    cache.delete(PULL_AUTHORS_KEY.format(user_id))
+    TimelineEntry.objects.filter(user_id=user_id,
+                                 author_id=author_id).delete()
+
+
+def pull_author_ids(user):
+    key = PULL_AUTHORS_KEY.format(user.id)
+    author_ids = cache.get(key)
+    if author_ids is None:
+        author_ids = list(UserStats.objects.filter(
+            user__following__user=user,
+            followers_count__gt=settings.FEED_FANOUT_MAX_FOLLOWERS,
+        ).values_list('user_id', flat=True))
+        cache.set(key, author_ids, PULL_AUTHORS_TIMEOUT)
+    return author_ids
+
+
+def follow_feed(user):
+    """Posts of the authors ``user`` follows, ordered by FEED_ORDERING."""
+    pulled = pull_author_ids(user)
+    if not pulled:
+        posts = Post.objects.filter(timeline_entries__user=user).annotate(
+            feed_date=F('timeline_entries__pub_date'),
+            feed_entry=F('timeline_entries__id'))
+    else:
+        timeline = TimelineEntry.objects.filter(user=user).values('post')
+        posts = Post.objects.filter(
+            Q(id__in=timeline) | Q(author_id__in=pulled)).annotate(
+            feed_date=F('pub_date'), feed_entry=F('id'))
+    return posts.order_by(*FEED_ORDERING)
+
+
+def backfill_timelines(users=None, follows=None):
+    """Rebuild timelines from Follow rows (all of them, or the ``follows``
+    queryset); returns the number of follows.
+    """
+    if follows is None:
+        follows = Follow.objects.all()
+    if users is not None:
+        follows = follows.filter(user__in=users)
+    follows = follows.values_list('user_id', 'author_id').iterator()
+    count = 0
+    while True:
+        batch = list(islice(follows, BATCH_SIZE))
+        if not batch:
+            return count
+        # one commit per batch: a commit per follow dominates on SQLite
+        with transaction.atomic():
+            for user_id, author_id in batch:
+                add_follow(user_id, author_id)
+        count += len(batch)
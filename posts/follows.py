@@ -0,0 +1,128 @@
+"""Follow and unfollow as single idempotent statements.
+
+``follow`` inserts the (user, author) pair with an insert that ignores the
+unique constraint; ``unfollow`` deletes it with a plain DELETE. Whichever
+request actually changed the row (rowcount 1) updates counters, timelines
+and cached pages, so double clicks and concurrent requests cannot count a
+follow twice. Follows created or deleted through the ORM get the same
+side effects from posts/signals.py.
+
+``followed_authors(request)`` answers "does the viewer follow this
+author?" for any number of authors on a page from one set of ids, cached
+per user until their next follow or unfollow.
+"""
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.utils.functional import cached_property
+
+from . import counters, feeds
+from .cache import bump
+from .models import Follow
+
+FOLLOWED_KEY = 'follows:{}'
+FOLLOWED_TIMEOUT = 60 * 60
+
+
+def followed_author_ids(user_id):
+    key = FOLLOWED_KEY.format(user_id)
+    author_ids = cache.get(key)
+    if author_ids is None:
+        author_ids = frozenset(Follow.objects.filter(
+            user_id=user_id).values_list('author_id', flat=True))
+        cache.set(key, author_ids, FOLLOWED_TIMEOUT)
+    return author_ids
+
+
+class FollowedAuthors:
+    """``author in followed`` for a User or an id; the ids are loaded on
+    the first check.
+    """
+
+    def __init__(self, user):
+        self.user = user
+
+    @cached_property
+    def ids(self):
+        if not self.user.is_authenticated:
+            return frozenset()
+        return followed_author_ids(self.user.pk)
+
+    def __contains__(self, author):
+        return getattr(author, 'pk', author) in self.ids
+
+
+def followed_authors(request):
+    """The viewer's FollowedAuthors, shared by everything in the request."""
+    if not hasattr(request, '_followed_authors'):
+        request._followed_authors = FollowedAuthors(request.user)
+    return request._followed_authors
+
+
+def _invalidate(user_id, username, author_username):
+    def invalidate():
+        cache.delete(FOLLOWED_KEY.format(user_id))
+        bump(f'profile:{author_username}', f'profile:{username}')
+    # now for the rest of this transaction, and again once it commits: a
+    # request that read the old rows in between may have cached them
+    invalidate()
+    transaction.on_commit(invalidate)
+
+
+def followed(user_id, author_id, username, author_username):
+    _invalidate(user_id, username, author_username)
+    counters.change_user_stats(author_id, 'followers_count', 1)
+    counters.change_user_stats(user_id, 'following_count', 1)
+    feeds.add_follow(user_id, author_id)
+
+
+def unfollowed(user_id, author_id, username, author_username):
+    _invalidate(user_id, username, author_username)
+    counters.change_user_stats(author_id, 'followers_count', -1)
+    counters.change_user_stats(user_id, 'following_count', -1)
+    feeds.remove_follow(user_id, author_id)
+
+
+def _insert_ignore(user_id, author_id):
+    ops = connection.ops
+    columns = ', '.join(map(ops.quote_name, ['user_id', 'author_id']))
+    sql = (f'{ops.insert_statement(ignore_conflicts=True)} '
+           f'{ops.quote_name(Follow._meta.db_table)} ({columns}) '
+           f'VALUES (%s, %s) '
+           f'{ops.ignore_conflicts_suffix_sql(ignore_conflicts=True)}')
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [user_id, author_id])
+        return cursor.rowcount
+
+
+def _delete(user_id, author_id):
+    ops = connection.ops
+    sql = (f'DELETE FROM {ops.quote_name(Follow._meta.db_table)} '
+           f'WHERE {ops.quote_name("user_id")} = %s '
+           f'AND {ops.quote_name("author_id")} = %s')
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [user_id, author_id])
+        return cursor.rowcount
+
+
+def follow(user, author_id, author_username):
+    """Make ``user`` follow the author; returns False if they already did
+    (or it is ``user`` themselves).
+    """
+    if user.id == author_id:
+        return False
+    with transaction.atomic():
+        if _insert_ignore(user.id, author_id) != 1:
+            return False
+        followed(user.id, author_id, user.username, author_username)
+    return True
+
+
+def unfollow(user, author_id, author_username):
+    """Returns False if ``user`` did not follow the author."""
+    with transaction.atomic():
+        # not QuerySet.delete(): its post_delete signal would apply the
+        # side effects a second time
+        if _delete(user.id, author_id) != 1:
+            return False
+        unfollowed(user.id, author_id, user.username, author_username)
+    return True
@@ -1,13 +1,42 @@
+from django.conf import settings
+from django.core.exceptions import ValidationError
 from django.forms import ModelForm
+from django.template.defaultfilters import filesizeformat
 
 from .models import Comment, Post
 
 
+def check_image_limits(upload):
+    """Reject uploads over POST_IMAGE_MAX_BYTES or POST_IMAGE_MAX_PIXELS.
+
+    ``upload.image`` is what ImageField got from Image.open(): only the
+    header has been read, so the pixels are never decoded in the request.
+    Decoding, downsizing and re-encoding happen in posts.tasks.
+    """
+    if upload.size > settings.POST_IMAGE_MAX_BYTES:
+        raise ValidationError(
+            'Файл больше %(limit)s.', code='too_large',
+            params={'limit': filesizeformat(settings.POST_IMAGE_MAX_BYTES)})
+    width, height = upload.image.size
+    if width * height > settings.POST_IMAGE_MAX_PIXELS:
+        raise ValidationError(
+            'Изображение больше %(limit)s мегапикселей.',
+            code='too_many_pixels',
+            params={'limit': settings.POST_IMAGE_MAX_PIXELS // 10 ** 6})
+
+
 class PostForm(ModelForm):
     class Meta:
         model = Post
         fields = ['group', 'text', 'image']
 
+    def clean_image(self):
+        image = self.cleaned_data['image']
+        # a new upload, not the image the post already has
+        if hasattr(image, 'image'):
+            check_image_limits(image)
+        return image
+
 
 class CommentForm(ModelForm):
     class Meta:
@@ -0,0 +1,138 @@
+import io
+import json
+import logging
+import os
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .cache import bump_post_pages
+from .models import Post
+
+try:
+    # registers AVIF with Pillow versions that lack it
+    import pillow_avif  # noqa: F401
+except ImportError:
+    pass
+
+logger = logging.getLogger(__name__)
+
+# Size of the image on post cards (templates/includes/card_post.html).
+CARD_SIZE = (960, 339)
+# Widths rendered for the card's srcset; CARD_SIZE is the <img> fallback.
+CARD_WIDTHS = (480, 960, 1440)
+CARD_QUALITY = 85
+ORIGINAL_QUALITY = 90
+
+# MIME type: (Pillow format, extension, save options), smallest first;
+# browsers take the first <source> they support.
+CARD_FORMATS = {
+    'image/avif': ('AVIF', 'avif', {'quality': 60}),
+    'image/webp': ('WEBP', 'webp', {'quality': 80, 'method': 6}),
+    'image/jpeg': ('JPEG', 'jpg', {'quality': CARD_QUALITY,
+                                   'optimize': True, 'progressive': True}),
+}
+Image.init()
+CARD_FORMATS = {mime: options for mime, options in CARD_FORMATS.items()
+                if options[0] in Image.SAVE}
+
+# Decoding anything bigger than what PostForm accepts raises
+# DecompressionBombError instead of allocating the pixels.
+Image.MAX_IMAGE_PIXELS = settings.POST_IMAGE_MAX_PIXELS
+
+
+def encode(image, quality):
+    """Re-encode without metadata: PNG if it has transparency, else JPEG."""
+    buffer = io.BytesIO()
+    if image.mode in ('RGBA', 'LA', 'P') and (
+            image.mode != 'P' or 'transparency' in image.info):
+        image.save(buffer, format='PNG', optimize=True)
+        extension = 'png'
+    else:
+        image.convert('RGB').save(buffer, format='JPEG', quality=quality,
+                                  optimize=True, progressive=True)
+        extension = 'jpg'
+    return ContentFile(buffer.getvalue()), extension
+
+
+def render_card(image, width=CARD_SIZE[0]):
+    """Crop ``image`` around the center to the card's aspect ratio and
+    scale it to ``width``.
+    """
+    height = round(width * CARD_SIZE[1] / CARD_SIZE[0])
+    return ImageOps.fit(image.convert('RGB'), (width, height), Image.LANCZOS,
+                        centering=(0.5, 0.5))
+
+
+def render_cards(image, base, storage):
+    """Store the card in every CARD_WIDTHS and CARD_FORMATS combination.
+
+    Returns the mapping kept in ``Post.card_variants``:
+    ``{mime: [[width, name], ...]}``.
+    """
+    variants = {}
+    for width in CARD_WIDTHS:
+        card = render_card(image, width)
+        for mime, (image_format, extension, options) in CARD_FORMATS.items():
+            buffer = io.BytesIO()
+            card.save(buffer, format=image_format, **options)
+            name = storage.save(f'posts/cards/{base}-{width}.{extension}',
+                                ContentFile(buffer.getvalue()))
+            variants.setdefault(mime, []).append([width, name])
+    return variants
+
+
+def load(source, max_side):
+    """Decode ``source`` no bigger than ``max_side`` on its longer side.
+
+    JPEGs are decoded at a reduced scale straight away (``draft``), so a
+    50 MP photo never takes 150 MB of RAM.
+    """
+    image = Image.open(source)
+    image.draft(None, (max_side, max_side))
+    # shrink before rotating, so only the small image is copied
+    image.thumbnail((max_side, max_side), Image.LANCZOS)
+    return ImageOps.exif_transpose(image)
+
+
+def _process(post_id, normalize):
+    post = Post.objects.filter(pk=post_id).first()
+    if post is None or not post.image:
+        return
+    uploaded = post.image.name
+    base = os.path.splitext(os.path.basename(uploaded))[0]
+    try:
+        with post.image.open('rb') as source:
+            image = load(source, settings.POST_IMAGE_MAX_SIDE)
+            if normalize:
+                original, extension = encode(image, ORIGINAL_QUALITY)
+                post.image.save(f'{base}.{extension}', original, save=False)
+            variants = render_cards(image, base, post.card_image.storage)
+    except (Image.UnidentifiedImageError, Image.DecompressionBombError):
+        logger.warning("Cannot process image %s of post %s",
+                       uploaded, post_id, exc_info=True)
+        return
+    fallback = dict(variants['image/jpeg'])[CARD_SIZE[0]]
+    # the author may have replaced the image while we were working
+    updated = Post.objects.filter(pk=post_id, image=uploaded).update(
+        image=post.image.name, card_image=fallback,
+        card_variants=json.dumps(variants), updated=timezone.now())
+    if updated:
+        bump_post_pages(post)
+
+
+def process_post_image(post_id):
+    """Normalize a freshly uploaded ``Post.image`` (EXIF orientation,
+    metadata stripped, downsized to POST_IMAGE_MAX_SIDE, re-encoded) and
+    render its card variants, so rendering a feed only emits URLs.
+    """
+    _process(post_id, normalize=True)
+
+
+def render_post_cards(post_id):
+    """Render the card variants again from the stored original, e.g. after
+    CARD_WIDTHS or CARD_FORMATS changed.
+    """
+    _process(post_id, normalize=False)
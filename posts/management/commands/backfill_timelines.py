@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from posts.feeds import backfill_timelines
+from posts.models import User
+
+
+class Command(BaseCommand):
+    help = "Заполнить ленты подписок по существующим подпискам (Follow)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('usernames', nargs='*',
+                            help="Только для этих пользователей")
+
+    def handle(self, *args, **options):
+        users = None
+        if options['usernames']:
+            users = User.objects.filter(username__in=options['usernames'])
+        count = backfill_timelines(users)
+        self.stdout.write(f"Обработано подписок: {count}")
@@ -0,0 +1,50 @@
+import os
+import statistics
+import tempfile
+import time
+
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand
+
+from posts.benchmark import percentile
+from yatube.sqlite_cache import SQLiteCache
+
+
+class Command(BaseCommand):
+    help = "Сравнить задержку попаданий в кэш: LocMemCache и SQLiteCache"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=5000)
+        parser.add_argument('--keys', type=int, default=200)
+        parser.add_argument('--value-size', type=int, default=20 * 1024,
+                            help="Размер значения в байтах (~ страница)")
+
+    def measure(self, cache, options):
+        value = 'x' * options['value_size']
+        keys = [f'page:{number}' for number in range(options['keys'])]
+        for key in keys:
+            cache.set(key, value, None)
+        samples = []
+        for number in range(options['iterations']):
+            key = keys[number % len(keys)]
+            started = time.perf_counter()
+            cache.get(key)
+            samples.append((time.perf_counter() - started) * 1e6)
+        return samples
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as directory:
+            backends = {
+                'locmem': LocMemCache('bench', {}),
+                'sqlite': SQLiteCache(os.path.join(directory, 'cache.db'),
+                                      {'OPTIONS': {'MAX_ENTRIES': 100000}}),
+            }
+            self.stdout.write(f"{'backend':10}{'mean':>10}{'p50':>10}"
+                              f"{'p95':>10}{'p99':>10}  (мкс на get)")
+            for name, cache in backends.items():
+                samples = self.measure(cache, options)
+                self.stdout.write(
+                    f"{name:10}{statistics.mean(samples):10.1f}"
+                    f"{percentile(samples, .5):10.1f}"
+                    f"{percentile(samples, .95):10.1f}"
+                    f"{percentile(samples, .99):10.1f}")
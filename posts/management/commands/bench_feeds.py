@@ -0,0 +1,58 @@
+import json
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from posts.benchmark import VIEWS, run
+
+COLUMNS = ('mean_ms', 'p50_ms', 'p95_ms', 'p99_ms', 'queries')
+
+
+class Command(BaseCommand):
+    help = ("Измерить задержку и число запросов к БД для лент на текущих "
+            "данных и сохранить результат")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50,
+                            help="Запросов к каждому представлению")
+        parser.add_argument('--views', nargs='+', choices=VIEWS,
+                            default=VIEWS)
+        parser.add_argument('--warm', action='store_true',
+                            help="Мерить с прогретым кэшем страниц")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output',
+                            help="Файл для результата (по умолчанию "
+                                 "benchmarks/<коммит>-<записей>.json)")
+        parser.add_argument('--compare',
+                            help="Сравнить с ранее сохранённым результатом")
+
+    def handle(self, *args, **options):
+        result = run(options['requests'], options['warm'], options['views'],
+                     options['seed'])
+        output = options['output'] or os.path.join(
+            settings.BASE_DIR, 'benchmarks',
+            f"{result['commit'] or 'worktree'}-{result['posts']}"
+            f"{'-warm' if result['warm'] else ''}.json")
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, 'w') as file:
+            json.dump(result, file, indent=2)
+
+        baseline = {}
+        if options['compare']:
+            with open(options['compare']) as file:
+                baseline = json.load(file)['views']
+        self.stdout.write(f"Записей: {result['posts']}, пользователей: "
+                          f"{result['users']}, кэш: "
+                          f"{'прогрет' if result['warm'] else 'пуст'}")
+        self.stdout.write(f"{'view':14}" + ''.join(
+            f'{column:>16}' for column in COLUMNS))
+        for view, numbers in result['views'].items():
+            cells = []
+            for column in COLUMNS:
+                cell = f'{numbers[column]:g}'
+                if view in baseline:
+                    cell += f' ({numbers[column] - baseline[view][column]:+g})'
+                cells.append(f'{cell:>16}')
+            self.stdout.write(f'{view:14}' + ''.join(cells))
+        self.stdout.write(f"Сохранено в {output}")
@@ -0,0 +1,58 @@
+import random
+import statistics
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+
+from posts.benchmark import VIEWS, Sampler, measure
+
+MIDDLEWARE = 'yatube.metrics.MetricsMiddleware'
+
+
+class Command(BaseCommand):
+    help = ("Сравнить задержку представлений с MetricsMiddleware и без "
+            "него на текущих данных")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200,
+                            help="Пар запросов к каждому представлению")
+        parser.add_argument('--views', nargs='+', choices=VIEWS,
+                            default=VIEWS)
+        parser.add_argument('--cold', action='store_true',
+                            help="Мерить с пустым кэшем страниц (по "
+                                 "умолчанию прогретый: худший случай "
+                                 "для относительных накладных расходов)")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def client(self, middleware):
+        client = Client()
+        # the handler reads MIDDLEWARE on its first request
+        with override_settings(MIDDLEWARE=middleware):
+            client.get('/')
+        return client
+
+    def handle(self, *args, **options):
+        without = [name for name in settings.MIDDLEWARE if name != MIDDLEWARE]
+        clients = {'off': self.client(without),
+                   'on': self.client([MIDDLEWARE] + without)}
+        sampler = Sampler(random.Random(options['seed']))
+        self.stdout.write(f"{'view':14}{'p50 off':>10}{'p50 on':>10}"
+                          f"{'overhead':>10}")
+        for view in options['views']:
+            if not sampler.available(view):
+                continue
+            timings = {'off': [], 'on': []}
+            for number in range(options['requests']):
+                # the same URL on both stacks, in alternating order
+                url, user = sampler.request(view)
+                order = ['off', 'on'] if number % 2 else ['on', 'off']
+                for name in order:
+                    if user is not None:
+                        clients[name].force_login(user)
+                    timings[name].append(measure(
+                        url, clients[name], not options['cold'])[0])
+            off = statistics.median(timings['off'])
+            on = statistics.median(timings['on'])
+            self.stdout.write(f'{view:14}{off:10.2f}{on:10.2f}'
+                              f'{(on - off) / off:10.1%}')
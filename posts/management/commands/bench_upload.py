@@ -0,0 +1,127 @@
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.files.uploadhandler import load_handler
+from django.core.management.base import BaseCommand
+from django.forms import ImageField
+from django.http.multipartparser import MultiPartParser
+from PIL import Image, ImageOps
+
+from posts import images
+from posts.forms import check_image_limits
+
+BOUNDARY = 'BenchUploadBoundary'
+
+# "stock" is the upload path before posts/uploads.py: Django's default
+# handlers, then a full-size decode of the original.
+HANDLERS = {
+    'stock': ['django.core.files.uploadhandler.MemoryFileUploadHandler',
+              'django.core.files.uploadhandler.TemporaryFileUploadHandler'],
+    'bounded': settings.FILE_UPLOAD_HANDLERS,
+}
+
+
+def make_request_body(path, megapixels):
+    """Write a multipart body with a JPEG of ``megapixels`` to ``path``."""
+    width = int((megapixels * 10 ** 6 * 4 / 3) ** 0.5)
+    height = megapixels * 10 ** 6 // width
+    bands = [Image.linear_gradient('L').resize((width, height)),
+             Image.radial_gradient('L').resize((width, height)),
+             Image.effect_noise((width, height), 32)]
+    jpeg_path = path + '.jpg'
+    Image.merge('RGB', bands).save(jpeg_path, quality=85)
+    with open(path, 'wb') as body, open(jpeg_path, 'rb') as jpeg:
+        body.write(f'--{BOUNDARY}\r\nContent-Disposition: form-data; '
+                   f'name="image"; filename="bench.jpg"\r\n'
+                   f'Content-Type: image/jpeg\r\n\r\n'.encode())
+        while True:
+            chunk = jpeg.read(1024 * 1024)
+            if not chunk:
+                break
+            body.write(chunk)
+        body.write(f'\r\n--{BOUNDARY}--\r\n'.encode())
+    os.remove(jpeg_path)
+    return width, height
+
+
+def peak_rss():
+    """Peak resident memory of this process in kilobytes."""
+    # ru_maxrss survives exec() on Linux, so a child would report the
+    # parent's peak; VmHWM belongs to the current program only.
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class Command(BaseCommand):
+    help = ("Измерить пиковую память (RSS) при загрузке изображения "
+            "до и после потоковой обработки")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--megapixels', type=int, nargs='+',
+                            default=[1, 10, 50])
+        # internal: measure one upload in a fresh process
+        parser.add_argument('--child', nargs=2,
+                            metavar=('MODE', 'BODY'), help="служебный")
+
+    def upload(self, mode, path):
+        """Parse, validate and process one upload as the site would."""
+        with open(path, 'rb') as body:
+            meta = {
+                'CONTENT_TYPE': f'multipart/form-data; boundary={BOUNDARY}',
+                'CONTENT_LENGTH': str(os.path.getsize(path)),
+            }
+            handlers = [load_handler(handler) for handler in HANDLERS[mode]]
+            _, files = MultiPartParser(meta, body, handlers).parse()
+        upload = ImageField().clean(files['image'])
+        if mode == 'stock':
+            with Image.open(upload) as image:
+                image = ImageOps.exif_transpose(image)
+        else:
+            check_image_limits(upload)
+            image = images.load(upload, settings.POST_IMAGE_MAX_SIDE)
+        images.encode(image, images.ORIGINAL_QUALITY)
+        images.encode(images.render_card(image), images.CARD_QUALITY)
+
+    def child(self, mode, path):
+        baseline = peak_rss()
+        started = time.perf_counter()
+        self.upload(mode, path)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f'{peak_rss() - baseline} {elapsed}')
+
+    def measure(self, mode, path):
+        output = subprocess.run(
+            [sys.executable, sys.argv[0], 'bench_upload',
+             '--child', mode, path],
+            check=True, capture_output=True, text=True).stdout
+        rss, elapsed = output.split()
+        return int(rss) / 1024, float(elapsed)
+
+    def handle(self, *args, **options):
+        if options['child']:
+            return self.child(*options['child'])
+        self.stdout.write(f"{'MP':>4}{'размер':>12}{'файл, МБ':>10}"
+                          f"{'stock, МБ':>12}{'bounded, МБ':>13}"
+                          f"{'stock, с':>10}{'bounded, с':>12}")
+        with tempfile.TemporaryDirectory() as directory:
+            for megapixels in options['megapixels']:
+                path = os.path.join(directory, f'{megapixels}.body')
+                width, height = make_request_body(path, megapixels)
+                stock_rss, stock_time = self.measure('stock', path)
+                bounded_rss, bounded_time = self.measure('bounded', path)
+                self.stdout.write(
+                    f"{megapixels:4}{f'{width}×{height}':>12}"
+                    f"{os.path.getsize(path) / 2 ** 20:10.1f}"
+                    f"{stock_rss:12.1f}{bounded_rss:13.1f}"
+                    f"{stock_time:10.2f}{bounded_time:12.2f}")
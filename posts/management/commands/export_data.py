@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from posts.transfer import FORMATS, MODELS, export
+
+
+class Command(BaseCommand):
+    help = "Выгрузить группы, записи, комментарии и подписки"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path',
+                            help="Файл (jsonl) или каталог (csv) для выгрузки")
+        parser.add_argument('--format', choices=FORMATS, default='jsonl')
+        parser.add_argument('--models', nargs='+', choices=MODELS,
+                            default=MODELS)
+
+    def handle(self, *args, **options):
+        written = export(options['path'], options['format'],
+                         options['models'])
+        self.stdout.write(", ".join(
+            f"{model}: {count}" for model, count in written.items()))
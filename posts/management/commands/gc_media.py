@@ -0,0 +1,30 @@
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from posts.models import Post
+from posts.storage import garbage
+
+
+class Command(BaseCommand):
+    help = "Удалить файлы изображений, на которые не ссылается ни один пост"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-age', type=float, default=24,
+                            help="Не трогать файлы моложе стольких часов")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Только показать, что будет удалено")
+
+    def handle(self, *args, **options):
+        root = Post._meta.get_field('image').upload_to.rstrip('/')
+        count = 0
+        for name in garbage(default_storage, root,
+                            timedelta(hours=options['min_age'])):
+            if options['dry_run']:
+                self.stdout.write(name)
+            else:
+                default_storage.delete(name)
+            count += 1
+        verb = "Будет удалено" if options['dry_run'] else "Удалено"
+        self.stdout.write(f"{verb} файлов: {count}")
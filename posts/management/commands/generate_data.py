@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from posts.synthetic import generate
+
+
+class Command(BaseCommand):
+    help = ("Сгенерировать пользователей, группы, записи, комментарии и "
+            "подписки для нагрузочного тестирования")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--posts', type=int, default=10000)
+        parser.add_argument('--comments', type=int, default=20000)
+        parser.add_argument('--groups', type=int, default=20)
+        parser.add_argument('--follows', type=int, default=20,
+                            help="Подписок на пользователя в среднем")
+        parser.add_argument('--skew', type=float, default=1.1,
+                            help="Показатель закона Ципфа для популярности "
+                                 "авторов")
+        parser.add_argument('--days', type=int, default=365,
+                            help="За сколько дней распределить записи")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--prefix', default='user',
+                            help="Префикс имён пользователей и групп")
+
+    def handle(self, *args, **options):
+        created = generate(
+            **{name: options[name] for name in (
+                'users', 'posts', 'comments', 'groups', 'follows', 'skew',
+                'days', 'seed', 'prefix')})
+        self.stdout.write(", ".join(
+            f"{model}: {count}" for model, count in created.items()))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from posts.transfer import BATCH_SIZE, FORMATS, Importer, read_rows
+
+
+class Command(BaseCommand):
+    help = "Загрузить группы, записи, комментарии и подписки из выгрузки"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Файл (jsonl) или каталог (csv)")
+        parser.add_argument('--format', choices=FORMATS, default='jsonl')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        importer = Importer(options['batch_size'])
+        for model, record in read_rows(options['path'], options['format']):
+            importer.add(model, record)
+        imported = importer.finish()
+        self.stdout.write(", ".join(
+            f"{model}: {count}" for model, count in imported.items()))
+        skipped = ", ".join(f"{model}: {count}" for model, count
+                            in importer.skipped.items() if count)
+        if skipped:
+            # duplicates, and comments of posts missing from the export
+            self.stdout.write(f"Пропущено: {skipped}")
+        if importer.missing_images:
+            self.stderr.write(f"Нет файлов изображений: "
+                              f"{importer.missing_images}")
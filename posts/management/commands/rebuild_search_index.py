@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from posts.search import get_index, rebuild
+
+
+class Command(BaseCommand):
+    help = "Перестроить поисковый индекс постов и комментариев"
+
+    def handle(self, *args, **options):
+        count = rebuild()
+        self.stdout.write(f"Проиндексировано постов: {count} "
+                          f"({type(get_index()).__name__})")
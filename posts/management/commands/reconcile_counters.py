@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from posts.counters import reconcile_comment_counts, reconcile_user_stats
+
+
+class Command(BaseCommand):
+    help = "Пересчитать счётчики подписчиков, подписок, записей и комментариев"
+
+    def handle(self, *args, **options):
+        users = reconcile_user_stats()
+        posts = reconcile_comment_counts()
+        self.stdout.write(f"Исправлено пользователей: {users}, "
+                          f"записей: {posts}")
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from posts.models import Post
+from posts.tasks import enqueue
+
+
+class Command(BaseCommand):
+    help = ("Поставить в очередь перерисовку карточек изображений "
+            "(WebP/AVIF/JPEG) из сохранённых оригиналов")
+
+    def handle(self, *args, **options):
+        count = 0
+        posts = Post.objects.exclude(image='').exclude(image=None)
+        for post_id in posts.values_list('id', flat=True).iterator():
+            enqueue('render_post_cards', post_id=post_id)
+            count += 1
+        self.stdout.write(f"Задач поставлено: {count}")
@@ -0,0 +1,48 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from posts import tasks
+
+
+class Command(BaseCommand):
+    help = "Выполнять фоновые задачи (обработка изображений и т. п.)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=2)
+        parser.add_argument('--once', action='store_true',
+                            help="Выполнить накопившиеся задачи и выйти")
+
+    def work(self, stop):
+        try:
+            while not stop.is_set():
+                if not tasks.run_pending(limit=100):
+                    stop.wait(settings.TASKS_POLL_INTERVAL)
+        finally:
+            connection.close()
+
+    def handle(self, *args, **options):
+        requeued = tasks.requeue_stale()
+        if requeued:
+            self.stdout.write(f"Возвращено в очередь: {requeued}")
+        if options['once']:
+            done = tasks.run_pending()
+            self.stdout.write(f"Выполнено задач: {done}")
+            return
+
+        stop = threading.Event()
+        workers = [threading.Thread(target=self.work, args=(stop,))
+                   for _ in range(options['threads'])]
+        for worker in workers:
+            worker.start()
+        try:
+            while True:
+                time.sleep(settings.TASKS_STALE_AFTER)
+                tasks.requeue_stale()
+        except KeyboardInterrupt:
+            stop.set()
+            for worker in workers:
+                worker.join()
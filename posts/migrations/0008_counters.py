@@ -0,0 +1,57 @@
+# Generated by Django 2.2.9 on 2026-10-18 04:59
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count
+
+
+def fill_counters(apps, schema_editor):
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    Follow = apps.get_model('posts', 'Follow')
+    Post = apps.get_model('posts', 'Post')
+    Comment = apps.get_model('posts', 'Comment')
+    UserStats = apps.get_model('posts', 'UserStats')
+
+    def totals(queryset, field):
+        return dict(queryset.order_by().values_list(field)
+                    .annotate(total=Count('pk')))
+
+    followers = totals(Follow.objects, 'author')
+    following = totals(Follow.objects, 'user')
+    posts = totals(Post.objects, 'author')
+    UserStats.objects.bulk_create(
+        (UserStats(user_id=user_id,
+                   followers_count=followers.get(user_id, 0),
+                   following_count=following.get(user_id, 0),
+                   posts_count=posts.get(user_id, 0))
+         for user_id in User.objects.values_list('id', flat=True)),
+        batch_size=500)
+    for post_id, total in totals(Comment.objects, 'post').items():
+        Post.objects.filter(id=post_id).update(comment_count=total)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0011_update_proxy_permissions'),
+        ('posts', '0007_timelineentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('followers_count', models.PositiveIntegerField(default=0)),
+                ('following_count', models.PositiveIntegerField(default=0)),
+                ('posts_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.9 on 2026-10-18 05:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0010_post_updated'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='card_image',
+            field=models.ImageField(blank=True, editable=False, upload_to='posts/cards/'),
+        ),
+    ]
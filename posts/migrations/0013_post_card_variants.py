@@ -0,0 +1,18 @@
+# Generated by Django 2.2.9 on 2026-10-18 05:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0012_task'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='card_variants',
+            field=models.TextField(blank=True, editable=False),
+        ),
+    ]
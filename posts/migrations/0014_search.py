@@ -0,0 +1,55 @@
+# Generated by Django 2.2.9 on 2026-10-18 05:19
+
+from django.db import OperationalError, migrations, models, transaction
+import django.db.models.deletion
+
+
+def create_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    try:
+        with transaction.atomic(using=schema_editor.connection.alias):
+            schema_editor.execute(
+                'CREATE VIRTUAL TABLE posts_search USING fts5(text, comments)')
+    except OperationalError:
+        # SQLite built without FTS5: posts.search uses SearchPosting
+        pass
+
+
+def drop_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS posts_search')
+
+
+def remind_to_fill_index(apps, schema_editor):
+    # The index is built by "manage.py rebuild_search_index" rather than
+    # here: it needs the stemmer and backends of posts.search, and a
+    # migration must not depend on application code that keeps changing.
+    Post = apps.get_model('posts', 'Post')
+    if Post.objects.using(schema_editor.connection.alias).exists():
+        print('\n  Run "manage.py rebuild_search_index" to index the '
+              'existing posts.')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0013_post_card_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchPosting',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64)),
+                ('weight', models.FloatField()),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='posts.Post')),
+            ],
+            options={
+                'unique_together': {('term', 'post')},
+            },
+        ),
+        migrations.RunPython(create_fts_table, drop_fts_table),
+        migrations.RunPython(remind_to_fill_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 2.2.9 on 2026-10-18 05:23
+
+import textwrap
+
+from django.db import migrations, models
+
+
+# posts.models.make_excerpt as of this migration: later changes to the
+# live function must not change what this migration does
+def make_excerpt(text, width=300):
+    size = 2 * width
+    while True:
+        collapsed = ' '.join(text[:size].split())
+        if len(collapsed) > width or size >= len(text):
+            break
+        size *= 2
+    if len(collapsed) <= width:
+        return collapsed
+    head = collapsed[:width + 1].rsplit(' ', 1)[0]
+    excerpt = textwrap.shorten(head, width=width - 6, placeholder='')
+    if not excerpt:
+        excerpt = head[:width - 6]
+    return excerpt + ' [...]'
+
+
+def fill_excerpts(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    batch = []
+    for post in Post.objects.only('id', 'text').iterator():
+        post.excerpt = make_excerpt(post.text)
+        batch.append(post)
+        if len(batch) == 500:
+            Post.objects.bulk_update(batch, ['excerpt'])
+            batch = []
+    Post.objects.bulk_update(batch, ['excerpt'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0014_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='excerpt',
+            field=models.CharField(blank=True, editable=False, max_length=300, verbose_name='Текст'),
+        ),
+        migrations.RunPython(fill_excerpts, migrations.RunPython.noop),
+    ]
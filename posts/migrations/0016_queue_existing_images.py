@@ -0,0 +1,37 @@
+import json
+
+from django.db import migrations
+
+BATCH_SIZE = 1000
+
+
+def queue_existing_images(apps, schema_editor):
+    # Posts uploaded before cards existed have an image but no card and
+    # would show the "being processed" placeholder until the image is
+    # replaced: queue the same task an upload does (posts.tasks).
+    Post = apps.get_model('posts', 'Post')
+    Task = apps.get_model('posts', 'Task')
+    db = schema_editor.connection.alias
+    post_ids = Post.objects.using(db).exclude(image='').exclude(
+        image__isnull=True).filter(card_image='').order_by('id').values_list(
+        'id', flat=True).iterator()
+    batch = []
+    for post_id in post_ids:
+        batch.append(Task(name='process_post_image',
+                          payload=json.dumps({'post_id': post_id})))
+        if len(batch) == BATCH_SIZE:
+            Task.objects.using(db).bulk_create(batch)
+            batch = []
+    Task.objects.using(db).bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0015_post_excerpt'),
+    ]
+
+    operations = [
+        migrations.RunPython(queue_existing_images,
+                             migrations.RunPython.noop),
+    ]
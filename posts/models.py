@@ -1,7 +1,9 @@
+import json
 import textwrap
 
 from django.contrib.auth import get_user_model
 from django.db import models
+from django.utils import timezone
 
 User = get_user_model()
 
@@ -15,6 +17,33 @@ class Group(models.Model):
         return self.title
 
 
+EXCERPT_LENGTH = 300
+
+
+def make_excerpt(text, width=EXCERPT_LENGTH):
+    """``textwrap.shorten(text, width)`` that only reads the head of a
+    long text instead of splitting and rejoining all of it; a first word
+    longer than the excerpt is cut instead of dropped.
+    """
+    # runs of whitespace collapse to one space, so read on until the
+    # collapsed head is longer than the excerpt or the text ends
+    size = 2 * width
+    while True:
+        collapsed = ' '.join(text[:size].split())
+        if len(collapsed) > width or size >= len(text):
+            break
+        size *= 2
+    if len(collapsed) <= width:
+        return collapsed
+    # cut at the last space before the limit, so no word is split
+    head = collapsed[:width + 1].rsplit(' ', 1)[0]
+    excerpt = textwrap.shorten(head, width=width - 6, placeholder='')
+    if not excerpt:
+        # no space to cut at, e.g. a long URL: cut the word itself
+        excerpt = head[:width - 6]
+    return excerpt + ' [...]'
+
+
 class Post(models.Model):
     text = models.TextField(
         help_text="Введите текст",
@@ -31,12 +60,46 @@ class Post(models.Model):
     image = models.ImageField(upload_to='posts/', blank=True, null=True,
                               help_text="Загрузите изображение",
                               verbose_name="Изображение")
+    # pre-rendered copy of ``image`` for post cards, see posts.images
+    card_image = models.ImageField(upload_to='posts/cards/', blank=True,
+                                   editable=False)
+    # JSON {mime: [[width, name], ...]} of the card in smaller formats
+    card_variants = models.TextField(blank=True, editable=False)
+    comment_count = models.PositiveIntegerField(default=0, editable=False)
+    # make_excerpt(text), kept up to date by posts.signals
+    excerpt = models.CharField("Текст", max_length=EXCERPT_LENGTH,
+                               blank=True, editable=False)
+    # bumped on every save; part of the cached post card key
+    updated = models.DateTimeField(auto_now=True)
 
     def __str__(self):
-        return textwrap.shorten(self.text, width=300)
+        # the stored excerpt, unless it is deferred or not filled yet
+        return self.__dict__.get('excerpt') or make_excerpt(self.text)
+
+    @property
+    def card_sources(self):
+        """``<source>`` attributes of the card variants for ``<picture>``."""
+        if not self.card_variants:
+            return []
+        storage = self.card_image.storage
+        return [
+            {'type': mime,
+             'srcset': ', '.join(f'{storage.url(name)} {width}w'
+                                 for width, name in files)}
+            for mime, files in json.loads(self.card_variants).items()
+        ]
 
     class Meta:
-        ordering = ["-pub_date"]
+        ordering = ["-pub_date", "-id"]
+        # Ascending on purpose: SQLite appends the rowid to every index, so
+        # scanning these backwards yields "pub_date DESC, id DESC" directly.
+        indexes = [
+            models.Index(fields=['pub_date'], name='post_pub_date'),
+            models.Index(fields=['author', 'pub_date'],
+                         name='post_author_pub_date'),
+            models.Index(fields=['group', 'pub_date'],
+                         name='post_group_pub_date'),
+        ]
 
 
 class Comment(models.Model):
@@ -48,6 +111,12 @@ class Comment(models.Model):
                             verbose_name="Комментарий")
     created = models.DateTimeField("date published", auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['post', 'created'],
+                         name='comment_post_created'),
+        ]
+
 
 class Follow(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE,
@@ -57,3 +126,76 @@ class Follow(models.Model):
 
     class Meta:
         unique_together = ['user', 'author']
+
+
+class TimelineEntry(models.Model):
+    """Materialized follow feed row: ``post`` is in ``user``'s feed."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE,
+                             related_name="timeline_entries")
+    post = models.ForeignKey(Post, on_delete=models.CASCADE,
+                             related_name="timeline_entries")
+    author = models.ForeignKey(User, on_delete=models.CASCADE,
+                               related_name="+")
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        unique_together = ['user', 'post']
+        indexes = [
+            models.Index(fields=['user', 'pub_date'],
+                         name='timeline_user_pub_date'),
+            models.Index(fields=['user', 'author'],
+                         name='timeline_user_author'),
+        ]
+
+
+class UserStats(models.Model):
+    """Denormalized per-user counters, kept current by posts.counters."""
+    user = models.OneToOneField(User, on_delete=models.CASCADE,
+                                primary_key=True, related_name="stats")
+    followers_count = models.PositiveIntegerField(default=0)
+    following_count = models.PositiveIntegerField(default=0)
+    posts_count = models.PositiveIntegerField(default=0)
+
+
+class Task(models.Model):
+    """Background job, see posts.tasks."""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = [(PENDING, 'В очереди'), (RUNNING, 'Выполняется'),
+                (DONE, 'Выполнена'), (FAILED, 'Ошибка')]
+
+    name = models.CharField(max_length=100)
+    payload = models.TextField(default='{}')
+    status = models.CharField(max_length=10, choices=STATUSES,
+                              default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    started = models.DateTimeField(blank=True, null=True)
+    created = models.DateTimeField(auto_now_add=True)
+    error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after'],
+                         name='task_status_run_after'),
+        ]
+
+    def __str__(self):
+        return f'{self.name} ({self.status})'
+
+
+class SearchPosting(models.Model):
+    """Inverted index row of posts.search.PostingIndex (used when SQLite
+    FTS5 is not available).
+    """
+    TERM_LENGTH = 64
+
+    term = models.CharField(max_length=TERM_LENGTH)
+    post = models.ForeignKey(Post, on_delete=models.CASCADE,
+                             related_name="+")
+    weight = models.FloatField()
+
+    class Meta:
+        unique_together = ["term", "post"]
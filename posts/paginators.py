@@ -0,0 +1,188 @@
+import json
+from collections.abc import Sequence
+
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Max, Q
+from django.utils.encoding import force_str
+from django.utils.functional import cached_property
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class CursorPage(Sequence):
+    is_cursor = True
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __repr__(self):
+        return '<Cursor page of %s items>' % len(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    @property
+    def next_cursor(self):
+        if self._has_next:
+            return self.paginator.encode_cursor(self.object_list[-1])
+        return None
+
+    @property
+    def previous_cursor(self):
+        if self._has_previous:
+            return self.paginator.encode_cursor(self.object_list[0])
+        return None
+
+
+class CursorPaginator:
+    """Keyset paginator: pages are addressed by the ordering values of the
+    first/last row instead of an offset, so neither COUNT(*) nor OFFSET is
+    issued and every page costs the same regardless of its depth.
+    """
+    is_cursor = True
+
+    def __init__(self, object_list, per_page, ordering=('-pub_date', '-id')):
+        self.object_list = object_list
+        self.per_page = int(per_page)
+        self.ordering = tuple(ordering)
+
+    def _fields(self):
+        query = self.object_list.query
+        fields = []
+        for name in self.ordering:
+            attr = name.lstrip('-')
+            if attr in query.annotations:
+                field = query.annotations[attr].output_field
+            else:
+                field = query.model._meta.get_field(attr)
+            fields.append((attr, name.startswith('-'), field))
+        return fields
+
+    def encode_cursor(self, obj):
+        values = []
+        for name, _, _ in self._fields():
+            value = getattr(obj, name)
+            values.append(value.isoformat() if hasattr(value, 'isoformat')
+                          else value)
+        return urlsafe_base64_encode(json.dumps(values).encode())
+
+    def decode_cursor(self, cursor):
+        try:
+            values = json.loads(force_str(urlsafe_base64_decode(cursor)))
+            fields = self._fields()
+            if len(values) != len(fields):
+                raise ValueError
+            return [field.to_python(value)
+                    for (_, _, field), value in zip(fields, values)]
+        except Exception:
+            raise InvalidCursor(cursor)
+
+    def _keyset_filter(self, values, forward):
+        """Lexicographic "comes after" condition over the ordering fields."""
+        condition = Q()
+        equal = {}
+        for (name, descending, _), value in zip(self._fields(), values):
+            lookup = 'lt' if descending == forward else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return condition
+
+    def page(self, after=None, before=None):
+        queryset = self.object_list
+        if before is not None:
+            values = self.decode_cursor(before)
+            reverse = [name[1:] if name.startswith('-') else '-' + name
+                       for name in self.ordering]
+            rows = list(queryset.filter(self._keyset_filter(values, False))
+                        .order_by(*reverse)[:self.per_page + 1])
+            has_previous = len(rows) > self.per_page
+            rows = rows[:self.per_page][::-1]
+            return CursorPage(rows, self, True, has_previous)
+
+        queryset = queryset.order_by(*self.ordering)
+        if after is not None:
+            values = self.decode_cursor(after)
+            queryset = queryset.filter(self._keyset_filter(values, True))
+        rows = list(queryset[:self.per_page + 1])
+        has_next = len(rows) > self.per_page
+        return CursorPage(rows[:self.per_page], self, has_next,
+                          after is not None)
+
+    def get_page(self, after=None, before=None):
+        """Like ``page`` but falls back to the first page on a bad cursor."""
+        try:
+            return self.page(after=after, before=before)
+        except InvalidCursor:
+            return self.page()
+
+
+def estimate_count(model, using='default'):
+    """Rough row count of ``model``'s table without scanning it, or None."""
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples::bigint FROM pg_class '
+                           'WHERE oid = %s::regclass', [table])
+            row = cursor.fetchone()
+            return row[0] if row and row[0] >= 0 else None
+        if connection.vendor == 'mysql':
+            cursor.execute('SELECT table_rows FROM information_schema.tables '
+                           'WHERE table_schema = DATABASE() '
+                           'AND table_name = %s', [table])
+            row = cursor.fetchone()
+            return row[0] if row else None
+        if connection.vendor == 'sqlite':
+            # statistics left by ANALYZE, if any; a table with indexes
+            # only has rows per index, each starting with the row count
+            cursor.execute("SELECT 1 FROM sqlite_master "
+                           "WHERE name = 'sqlite_stat1'")
+            if cursor.fetchone():
+                cursor.execute('SELECT stat FROM sqlite_stat1 '
+                               'WHERE tbl = %s LIMIT 1', [table])
+                row = cursor.fetchone()
+                if row:
+                    return int(row[0].split()[0])
+    # the largest primary key is read off the index; it over-counts by
+    # the number of deleted rows
+    return model._default_manager.using(using).aggregate(
+        estimate=Max('pk'))['estimate'] or 0
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator for admin changelists of big tables.
+
+    An unfiltered changelist is counted with estimate_count() instead of
+    COUNT(*); filtered ones, and tables smaller than EXACT_BELOW rows, are
+    counted exactly.
+    """
+    EXACT_BELOW = 10000
+
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, 'query', None)
+        if query is not None and not query.where and not query.distinct:
+            estimate = estimate_count(self.object_list.model,
+                                      self.object_list.db)
+            if estimate is not None and estimate >= self.EXACT_BELOW:
+                return estimate
+        return super().count
@@ -0,0 +1,236 @@
+"""Full-text search over posts and their comments.
+
+Words are lowercased and stemmed (posts/stemmer.py) before they reach the
+index, so "футболом" finds "футбол". Two interchangeable backends keep the
+index:
+
+* ``FTS5Index``: an SQLite FTS5 table (``posts_search``) ranked by bm25;
+* ``PostingIndex``: an inverted index in the SearchPosting table, for
+  databases without FTS5.
+
+SEARCH_BACKEND picks one; "auto" uses FTS5 when the table exists. Posts are
+re-indexed by the ``index_post`` task (posts/tasks.py), which signals
+(posts/signals.py) queue after post and comment writes, so new text is
+found once the task worker has run; ``manage.py rebuild_search_index``
+rebuilds everything.
+"""
+import math
+import re
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, Count, F, FloatField, Sum, When
+
+from .cache import bump
+from .models import Comment, Post, SearchPosting
+from .paginators import estimate_count
+from .stemmer import stem
+
+FTS_TABLE = 'posts_search'
+TOKEN = re.compile(r'\w+')
+# matches in comments count less than in the post itself
+COMMENTS_WEIGHT = 0.3
+STOP_WORDS = frozenset(
+    'а без бы в во вот да для до же за и из или к как ко ли на над не ни '
+    'но о об от по под при про с со так то у уж что это'.split())
+
+
+def terms(text):
+    """Stems of the words of ``text`` in order, stop words dropped."""
+    return [stem(word) for word in TOKEN.findall(text.lower())
+            if word not in STOP_WORDS]
+
+
+class FTS5Index:
+
+    def index(self, post_id, text, comments):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s',
+                           [post_id])
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, text, comments) '
+                f'VALUES (%s, %s, %s)',
+                [post_id, ' '.join(terms(text)),
+                 ' '.join(terms(' '.join(comments)))])
+
+    def remove(self, post_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s',
+                           [post_id])
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+
+    @staticmethod
+    def match(query_terms):
+        # every term is quoted, so words like NOT or NEAR are plain words
+        return ' '.join(f'"{term}"' for term in query_terms)
+
+    def count(self, query_terms):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT COUNT(*) FROM {FTS_TABLE} '
+                f'WHERE {FTS_TABLE} MATCH %s', [self.match(query_terms)])
+            return cursor.fetchone()[0]
+
+    def search(self, query_terms, offset, limit):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s '
+                f'ORDER BY bm25({FTS_TABLE}, 1.0, {COMMENTS_WEIGHT}), '
+                f'rowid DESC LIMIT %s OFFSET %s',
+                [self.match(query_terms), limit, offset])
+            return [row[0] for row in cursor.fetchall()]
+
+
+class PostingIndex:
+    """(term, post, weight) rows; a post matches if it has every term and
+    is ranked by the sum of weight × idf.
+    """
+
+    def index(self, post_id, text, comments):
+        weights = Counter()
+        for term in terms(text):
+            weights[term] += 1
+        for term in terms(' '.join(comments)):
+            weights[term] += COMMENTS_WEIGHT
+        SearchPosting.objects.filter(post_id=post_id).delete()
+        SearchPosting.objects.bulk_create(
+            # saturating like bm25: the tenth repeat adds little
+            [SearchPosting(term=term[:SearchPosting.TERM_LENGTH],
+                           post_id=post_id, weight=tf / (tf + 1.2))
+             for term, tf in weights.items()],
+            batch_size=500)
+
+    def remove(self, post_id):
+        SearchPosting.objects.filter(post_id=post_id).delete()
+
+    def clear(self):
+        SearchPosting.objects.all().delete()
+
+    def matches(self, query_terms):
+        query_terms = [term[:SearchPosting.TERM_LENGTH]
+                       for term in set(query_terms)]
+        return SearchPosting.objects.filter(term__in=query_terms).values(
+            'post').annotate(matched=Count('id')).filter(
+            matched=len(query_terms)), query_terms
+
+    def count(self, query_terms):
+        return self.matches(query_terms)[0].count()
+
+    def search(self, query_terms, offset, limit):
+        matches, query_terms = self.matches(query_terms)
+        # idf only needs the order of magnitude: no COUNT(*) per query
+        total = estimate_count(Post) or 1
+        frequency = dict(SearchPosting.objects.filter(
+            term__in=query_terms).values('term').annotate(
+            posts=Count('id')).values_list('term', 'posts'))
+        score = Sum(Case(
+            *[When(term=term, then=F('weight') * math.log(
+                1 + total / frequency.get(term, 1)))
+              for term in query_terms],
+            output_field=FloatField()))
+        return list(matches.annotate(score=score).order_by(
+            '-score', '-post').values_list('post', flat=True)[
+            offset:offset + limit])
+
+
+# database name -> whether it has the FTS5 table
+_fts5_tables = {}
+
+
+def fts5_available():
+    if connection.vendor != 'sqlite':
+        return False
+    name = connection.settings_dict['NAME']
+    if name not in _fts5_tables:
+        _fts5_tables[name] = (
+            FTS_TABLE in connection.introspection.table_names())
+    return _fts5_tables[name]
+
+
+def get_index():
+    backend = settings.SEARCH_BACKEND
+    if backend == 'auto':
+        backend = 'fts5' if fts5_available() else 'postings'
+    return FTS5Index() if backend == 'fts5' else PostingIndex()
+
+
+def _documents(posts):
+    """(post_id, text, comments) for (post_id, text) pairs."""
+    comments = {}
+    for post_id, text in Comment.objects.filter(
+            post_id__in=[post_id for post_id, _ in posts]).order_by(
+            'id').values_list('post_id', 'text'):
+        comments.setdefault(post_id, []).append(text)
+    for post_id, text in posts:
+        yield post_id, text, comments.get(post_id, [])
+
+
+def index_post(post_id):
+    index = get_index()
+    post = list(Post.objects.filter(pk=post_id).values_list('id', 'text'))
+    if not post:
+        index.remove(post_id)
+    for document in _documents(post):
+        index.index(*document)
+
+
+def remove_post(post_id):
+    get_index().remove(post_id)
+
+
+def _index_batch(index, posts):
+    # one commit per batch rather than per statement
+    with transaction.atomic():
+        for document in _documents(posts):
+            index.index(*document)
+
+
+def index_posts(posts, batch_size=500):
+    """Re-index the posts of the ``posts`` queryset; returns how many."""
+    index = get_index()
+    count = 0
+    batch = []
+    for post in posts.order_by().values_list('id', 'text').iterator():
+        batch.append(post)
+        if len(batch) == batch_size:
+            _index_batch(index, batch)
+            count += len(batch)
+            batch = []
+    _index_batch(index, batch)
+    # cached search pages (posts.views.search)
+    bump('index_page')
+    return count + len(batch)
+
+
+def rebuild(batch_size=500):
+    """Re-index every post; returns how many were indexed."""
+    get_index().clear()
+    return index_posts(Post.objects.all(), batch_size)
+
+
+class SearchResults:
+    """Lazy hits for ``query``, sliceable like a queryset by Paginator."""
+    ordered = True
+
+    def __init__(self, query, queryset):
+        self.terms = terms(query)
+        self.queryset = queryset
+        self.index = get_index()
+
+    def count(self):
+        return self.index.count(self.terms) if self.terms else 0
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, item):
+        if not self.terms:
+            return []
+        ids = self.index.search(self.terms, item.start or 0,
+                                item.stop - (item.start or 0))
+        posts = self.queryset.in_bulk(ids)
+        return [posts[post_id] for post_id in ids if post_id in posts]
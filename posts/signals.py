@@ -0,0 +1,122 @@
+import threading
+
+from django.db.models.signals import (post_delete, post_init, post_save,
+                                      pre_delete, pre_save)
+from django.dispatch import receiver
+
+from . import counters, feeds, follows, search, tasks
+from .cache import SITE_SCOPE, bump, bump_post_pages
+from .models import (Comment, Follow, Group, Post, User, UserStats,
+                     make_excerpt)
+
+# ids of the posts this thread is deleting, between pre_ and post_delete
+_deleting = threading.local()
+
+
+def deleting_post_ids():
+    if not hasattr(_deleting, 'post_ids'):
+        _deleting.post_ids = set()
+    return _deleting.post_ids
+
+
+@receiver(post_save, sender=User)
+def user_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        UserStats.objects.get_or_create(user=instance)
+
+
+def image_name(post):
+    # avoid loading a deferred field just to remember it
+    value = post.__dict__.get('image')
+    return getattr(value, 'name', value) or ''
+
+
+@receiver(post_init, sender=Post)
+def post_loaded(sender, instance, **kwargs):
+    instance._initial_group_id = instance.group_id
+    instance._initial_image = image_name(instance)
+    instance._initial_text = instance.__dict__.get('text')
+
+
+@receiver(pre_save, sender=Post)
+def post_saving(sender, instance, raw=False, **kwargs):
+    instance.excerpt = make_excerpt(instance.text)
+    if not raw and image_name(instance) != instance._initial_image:
+        # the old card no longer matches; a placeholder is shown until
+        # the process_post_image task has made a new one
+        instance.card_image = ''
+        instance.card_variants = ''
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if image_name(instance) and (
+            image_name(instance) != instance._initial_image):
+        tasks.enqueue('process_post_image', post_id=instance.pk)
+    bump_post_pages(instance)
+    if created or instance.text != instance._initial_text:
+        tasks.enqueue_once('index_post', post_id=instance.pk)
+    instance._initial_group_id = instance.group_id
+    instance._initial_image = image_name(instance)
+    instance._initial_text = instance.text
+    if created:
+        counters.change_user_stats(instance.author_id, 'posts_count', 1)
+        feeds.fan_out_post(instance)
+
+
+@receiver(pre_delete, sender=Post)
+def post_deleting(sender, instance, **kwargs):
+    deleting_post_ids().add(instance.pk)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    deleting_post_ids().discard(instance.pk)
+    bump_post_pages(instance)
+    counters.change_user_stats(instance.author_id, 'posts_count', -1)
+    search.remove_post(instance.pk)
+
+
+@receiver(post_save, sender=Comment)
+def comment_created(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        bump('index_page', f'post:{instance.post_id}')
+        counters.change_comment_count(instance.post_id, 1)
+    # re-indexing reads every comment of the post: done by the task
+    # worker, once for a burst of comments
+    tasks.enqueue_once('index_post', post_id=instance.post_id)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    if instance.post_id in deleting_post_ids():
+        # deleted with its post: the post's counter, index entry and
+        # pages go as well (post_deleted)
+        return
+    bump('index_page', f'post:{instance.post_id}')
+    counters.change_comment_count(instance.post_id, -1)
+    tasks.enqueue_once('index_post', post_id=instance.post_id)
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def group_changed(sender, instance, **kwargs):
+    # group titles and descriptions are shown on cards across all pages
+    bump(SITE_SCOPE)
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        follows.followed(instance.user_id, instance.author_id,
+                         instance.user.username, instance.author.username)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    follows.unfollowed(instance.user_id, instance.author_id,
+                       instance.user.username, instance.author.username)
@@ -0,0 +1,102 @@
+"""Snowball stemmer for Russian (snowballstem.org/algorithms/russian)."""
+
+VOWELS = 'аеиоуыэюя'
+
+
+def _endings(words):
+    # longest first, so the first match is the longest one
+    return sorted(words.split(), key=len, reverse=True)
+
+
+# (endings that must follow "а" or "я", endings without that condition)
+PERFECTIVE_GERUND = (_endings('в вши вшись'),
+                     _endings('ив ивши ившись ыв ывши ывшись'))
+PARTICIPLE = (_endings('ем нн вш ющ щ'), _endings('ивш ывш ующ'))
+VERB = (
+    _endings('ла на ете йте ли й л ем н ло но ет ют ны ть ешь нно'),
+    _endings('ила ыла ена ейте уйте ите или ыли ей уй ил ыл им ым ен ило '
+             'ыло ено ят ует уют ит ыт ены ить ыть ишь ую ю'),
+)
+ADJECTIVE = _endings('ее ие ые ое ими ыми ей ий ый ой ем им ым ом его ого '
+                     'ему ому их ых ую юю ая яя ою ею')
+REFLEXIVE = _endings('ся сь')
+NOUN = _endings('а ев ов ие ье е иями ями ами еи ии и ией ей ой ий й иям ям '
+                'ием ем ам ом о у ах иях ях ы ь ию ью ю ия ья я')
+DERIVATIONAL = _endings('ост ость')
+SUPERLATIVE = _endings('ейш ейше')
+
+
+def _remove(word, endings):
+    """``word`` without the longest of ``endings``, or None."""
+    for ending in endings:
+        if word.endswith(ending):
+            return word[:-len(ending)]
+    return None
+
+
+def _remove_grouped(word, groups):
+    conditional, plain = groups
+    for ending in sorted(conditional + plain, key=len, reverse=True):
+        if word.endswith(ending):
+            stem = word[:-len(ending)]
+            if ending in conditional and stem[-1:] not in ('а', 'я'):
+                return None
+            return stem
+    return None
+
+
+def _region(word, start=0):
+    """Start of the region after the first non-vowel following a vowel."""
+    for position in range(start + 1, len(word)):
+        if word[position] not in VOWELS and word[position - 1] in VOWELS:
+            return position + 1
+    return len(word)
+
+
+def stem(word):
+    word = word.lower().replace('ё', 'е')
+    rv = next((position + 1 for position, letter in enumerate(word)
+               if letter in VOWELS), len(word))
+    r2 = _region(word, _region(word))
+    prefix, rest = word[:rv], word[rv:]
+
+    # Step 1
+    stemmed = _remove_grouped(rest, PERFECTIVE_GERUND)
+    if stemmed is None:
+        reflexive = _remove(rest, REFLEXIVE)
+        if reflexive is not None:
+            rest = reflexive
+        stemmed = _remove(rest, ADJECTIVE)
+        if stemmed is not None:
+            participle = _remove_grouped(stemmed, PARTICIPLE)
+            if participle is not None:
+                stemmed = participle
+        else:
+            stemmed = _remove_grouped(rest, VERB)
+            if stemmed is None:
+                stemmed = _remove(rest, NOUN)
+        if stemmed is None:
+            stemmed = rest
+    rest = stemmed
+
+    # Step 2
+    if rest.endswith('и'):
+        rest = rest[:-1]
+
+    # Step 3
+    derivational = _remove(rest, DERIVATIONAL)
+    if derivational is not None and len(prefix) + len(derivational) >= r2:
+        rest = derivational
+
+    # Step 4
+    if rest.endswith('нн'):
+        rest = rest[:-1]
+    else:
+        superlative = _remove(rest, SUPERLATIVE)
+        if superlative is not None:
+            rest = superlative
+            if rest.endswith('нн'):
+                rest = rest[:-1]
+        elif rest.endswith('ь'):
+            rest = rest[:-1]
+    return prefix + rest
@@ -0,0 +1,85 @@
+"""Content-addressed media storage.
+
+Files are named after the SHA-256 of their content, so an image uploaded
+twice is stored once and a name never changes meaning, which lets media be
+served with far-future cache headers. Nothing is deleted when a post
+changes or goes away, because other posts may share the file; run
+``manage.py gc_media`` to remove unreferenced files.
+"""
+import hashlib
+import json
+import os
+import posixpath
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils import timezone
+
+# hex digits of the digest kept in the name (128 bits)
+DIGEST_LENGTH = 32
+
+
+class HashedFileSystemStorage(FileSystemStorage):
+
+    def hashed_name(self, name, content):
+        """``posts/ab/ab12….jpg`` for a file saved as ``posts/x.jpg``."""
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        digest = digest.hexdigest()[:DIGEST_LENGTH]
+        extension = os.path.splitext(name)[1].lower()
+        return posixpath.join(posixpath.dirname(name), digest[:2],
+                              digest + extension)
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.hashed_name(self.generate_filename(name), content)
+        if self.exists(name):
+            # the same content is already stored; refresh its mtime so
+            # gc_media does not take it for an old orphan
+            os.utime(self.path(name))
+            return name
+        return self._save(name, content)
+
+
+def referenced_names():
+    """Names of every file a Post points to."""
+    from .models import Post
+
+    names = set()
+    rows = Post.objects.values_list('image', 'card_image', 'card_variants')
+    for image, card_image, card_variants in rows.iterator():
+        names.update((image, card_image))
+        if card_variants:
+            for files in json.loads(card_variants).values():
+                names.update(name for width, name in files)
+    names.discard('')
+    names.discard(None)
+    return names
+
+
+def walk(storage, path):
+    directories, files = storage.listdir(path)
+    for name in files:
+        yield posixpath.join(path, name)
+    for directory in directories:
+        yield from walk(storage, posixpath.join(path, directory))
+
+
+def garbage(storage, root, min_age):
+    """Files under ``root`` no post refers to, older than ``min_age``.
+
+    Young files are skipped: they may belong to an upload or a processing
+    task whose Post row is not committed yet.
+    """
+    if not storage.exists(root):
+        return
+    referenced = referenced_names()
+    deadline = timezone.now() - min_age
+    for name in walk(storage, root):
+        if name not in referenced and (
+                storage.get_modified_time(name) < deadline):
+            yield name
@@ -0,0 +1,84 @@
+"""Synthetic social graph for load testing.
+
+Records are generated lazily and written through posts.transfer.Importer,
+so a million posts take constant memory and end up with the same
+counters, timelines and search index as imported data.
+
+Who gets followed and who writes follows a Zipf law: the author ranked
+``k`` is picked with weight ``1 / k ** skew``, so a few authors have most
+of the followers and posts, like on a real site.
+"""
+import itertools
+import random
+from datetime import timedelta
+
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import Post
+from .transfer import BATCH_SIZE, Importer
+
+WORDS = ('лыжи футбол музыка книга вечер утро город река лес море поезд '
+         'дорога концерт фильм песня друг работа отпуск погода кофе').split()
+
+
+def zipf_weights(count, skew):
+    """Cumulative weights of ranks 1..count for random.choices."""
+    return list(itertools.accumulate(
+        1 / rank ** skew for rank in range(1, count + 1)))
+
+
+def sentence(rng, words=12):
+    return ' '.join(rng.choice(WORDS) for _ in range(
+        rng.randint(words // 2, words * 2))).capitalize()
+
+
+def records(users, posts, comments, groups, follows, skew=1.1, days=365,
+            seed=0, prefix='user'):
+    """Yield ``(model, record)`` in the order Importer expects."""
+    rng = random.Random(seed)
+    usernames = [f'{prefix}{number}' for number in range(users)]
+    # a random popularity ranking, so user0 is not always the star
+    ranked = usernames[:]
+    rng.shuffle(ranked)
+    weights = zipf_weights(users, skew)
+    slugs = [f'{prefix}-group-{number}' for number in range(groups)]
+
+    for slug in slugs:
+        yield 'group', {'slug': slug, 'title': slug,
+                        'description': sentence(rng, 6)}
+
+    first_id = (Post.objects.aggregate(last=Max('id'))['last'] or 0) + 1
+    started = timezone.now() - timedelta(days=days)
+    step = timedelta(days=days) / max(posts, 1)
+    for number in range(posts):
+        yield 'post', {
+            'id': first_id + number,
+            'pub_date': (started + step * number).isoformat(),
+            'author': rng.choices(ranked, cum_weights=weights)[0],
+            'group': rng.choice(slugs) if slugs and rng.random() < .5
+            else '',
+            'text': sentence(rng, 30),
+        }
+
+    for _ in range(comments if posts else 0):
+        yield 'comment', {
+            'post': first_id + rng.randrange(posts),
+            'author': rng.choice(usernames),
+            'created': timezone.now().isoformat(),
+            'text': sentence(rng, 8),
+        }
+
+    # ``follows`` per user on average; duplicates are dropped on import
+    for user in usernames:
+        for _ in range(rng.randint(0, 2 * follows)):
+            author = rng.choices(ranked, cum_weights=weights)[0]
+            if author != user:
+                yield 'follow', {'user': user, 'author': author}
+
+
+def generate(batch_size=BATCH_SIZE, **options):
+    importer = Importer(batch_size)
+    for model, record in records(**options):
+        importer.add(model, record)
+    return importer.finish()
@@ -0,0 +1,122 @@
+"""A small task queue stored in the database.
+
+Views call ``enqueue()``, which only inserts a Task row, and return at once;
+``manage.py run_tasks`` (a separate local process with worker threads)
+claims pending rows and runs the registered functions. Rows survive
+restarts: tasks left running by a killed worker are picked up again after
+TASKS_STALE_AFTER seconds, failed ones are retried TASKS_MAX_ATTEMPTS times.
+"""
+import json
+import logging
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from . import images, search
+from .cache import bump
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+registry = {}
+
+
+def task(func):
+    registry[func.__name__] = func
+    return func
+
+
+def enqueue(name, **kwargs):
+    if name not in registry:
+        raise KeyError(f'Unknown task {name}')
+    return Task.objects.create(name=name, payload=json.dumps(kwargs))
+
+
+def enqueue_once(name, **kwargs):
+    """Like enqueue, unless the same task is already pending: it has not
+    read anything yet, so it covers this call too.
+    """
+    if name not in registry:
+        raise KeyError(f'Unknown task {name}')
+    payload = json.dumps(kwargs)
+    pending = Task.objects.filter(status=Task.PENDING, name=name,
+                                  payload=payload).first()
+    return pending or Task.objects.create(name=name, payload=payload)
+
+
+def requeue_stale():
+    deadline = timezone.now() - timedelta(
+        seconds=settings.TASKS_STALE_AFTER)
+    return Task.objects.filter(status=Task.RUNNING,
+                               started__lt=deadline).update(
+        status=Task.PENDING)
+
+
+def claim():
+    """Atomically take the oldest runnable task, or return None."""
+    while True:
+        candidate = Task.objects.filter(
+            status=Task.PENDING, run_after__lte=timezone.now()
+        ).order_by('run_after', 'id').values_list('id', flat=True).first()
+        if candidate is None:
+            return None
+        # another worker may win the race for the same row
+        claimed = Task.objects.filter(id=candidate,
+                                      status=Task.PENDING).update(
+            status=Task.RUNNING, started=timezone.now())
+        if claimed:
+            return Task.objects.get(id=candidate)
+
+
+def run(task_row):
+    task_row.attempts += 1
+    try:
+        registry[task_row.name](**json.loads(task_row.payload))
+    except Exception:
+        logger.exception("Task %s failed", task_row)
+        task_row.error = traceback.format_exc()
+        if task_row.attempts < settings.TASKS_MAX_ATTEMPTS:
+            task_row.status = Task.PENDING
+            task_row.run_after = timezone.now() + timedelta(
+                seconds=30 * task_row.attempts)
+        else:
+            task_row.status = Task.FAILED
+    else:
+        task_row.status = Task.DONE
+        task_row.error = ''
+    task_row.save(update_fields=['attempts', 'status', 'run_after',
+                                 'error'])
+    return task_row.status == Task.DONE
+
+
+def run_pending(limit=None):
+    """Run runnable tasks until none is left; returns how many ran."""
+    done = 0
+    while limit is None or done < limit:
+        close_old_connections()
+        task_row = claim()
+        if task_row is None:
+            break
+        run(task_row)
+        done += 1
+    return done
+
+
+@task
+def process_post_image(post_id):
+    images.process_post_image(post_id)
+
+
+@task
+def render_post_cards(post_id):
+    images.render_post_cards(post_id)
+
+
+@task
+def index_post(post_id):
+    search.index_post(post_id)
+    # cached search pages (posts.views.search) were rendered before
+    bump('index_page')
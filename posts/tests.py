@@ -1,14 +1,35 @@
 import io
+import json
+import os
+import re
 import tempfile
+import textwrap
+import threading
+import time
+import unittest
+from unittest import mock
 from urllib.parse import urljoin
 
 from django.core.cache import cache
 from django.core.files.base import ContentFile
-from django.test import Client, TestCase, override_settings
+from django.core.management import call_command
+from django.db import OperationalError, connection, transaction
+from django.test import (Client, RequestFactory, TestCase,
+                         TransactionTestCase, override_settings)
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from PIL import Image
 
-from .models import Comment, Follow, Group, Post, User
+from .cache import GENERATION_KEY, SITE_SCOPE
+from .follows import (FOLLOWED_KEY, follow, followed_author_ids,
+                      followed_authors, unfollow)
+from .models import (Comment, Follow, Group, Post, Task, TimelineEntry,
+                     User, UserStats, make_excerpt)
+from .tasks import run_pending
+from .paginators import (CursorPaginator, EstimatedCountPaginator,
+                         estimate_count)
+from .search import FTS5Index, fts5_available, get_index
+from .stemmer import stem
 
 
 class Hw05_Final_Test(TestCase):
@@ -169,6 +190,7 @@ class Hw05_Final_Test(TestCase):
         self.assertEqual(post_counter, 0)
 
     def test_cache(self):
+        cache.clear()
         post_one = self.auth_client.post(
                 reverse('new_post'),
                 data={"text": "Текст первого поста",
@@ -177,10 +199,13 @@ class Hw05_Final_Test(TestCase):
                 follow=True)
         response_first_post = self.auth_client.get(reverse('index'))
 
-        self.assertNotContains(response_first_post, "Текст первого поста")
+        self.assertContains(response_first_post, "Текст первого поста")
         self.assertEqual(post_one.status_code, 200)
 
-        cache.clear()
+        # nothing changed: the page comes from the cache without rendering
+        response_cached = self.auth_client.get(self.urls['index'])
+        self.assertContains(response_cached, "Текст первого поста")
+        self.assertIsNone(response_cached.context)
 
         post_two = self.auth_client.post(
                 reverse('new_post'),
@@ -208,7 +233,7 @@ class Hw05_Final_Test(TestCase):
         follow_counter = Follow.objects.count()
 
         self.assertEqual(response_follow.status_code, 200)
-        self.assertTrue(response_follow.context['following'])
+        self.assertContains(response_follow, "Отписаться")
         self.assertEqual(follow_counter, 1)
 
     def test_auth_user_can_unfollow(self):
@@ -231,7 +256,7 @@ class Hw05_Final_Test(TestCase):
 
         follow_counter = Follow.objects.count()
         self.assertEqual(response_unfollow.status_code, 200)
-        self.assertFalse(response_unfollow.context['following'])
+        self.assertContains(response_unfollow, "Подписаться")
         self.assertEqual(follow_counter, 0)
 
     def test_new_post_appears_on_user_follower_pages(self):
@@ -310,3 +335,1228 @@ class Hw05_Final_Test(TestCase):
 
     def tearDown(self):
         print("Тест выполнен")
+
+
+class FeedQueriesTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="MegaDen")
+        self.author = User.objects.create_user(username="Fedun")
+        self.group = Group.objects.create(
+            title='RadioFM',
+            slug='radiofm',
+            description='Только новая музыка'
+        )
+        Follow.objects.create(user=self.user, author=self.author)
+        self.auth_client = Client()
+        self.auth_client.force_login(self.user)
+        self.urls = {
+            'index': reverse('index'),
+            'group_posts': reverse('group_posts',
+                                   kwargs={'slug': self.group.slug}),
+            'profile': reverse('profile',
+                               kwargs={'username': self.author.username}),
+            'follow_index': reverse('follow_index'),
+        }
+
+    def create_posts(self, count):
+        for number in range(count):
+            post = Post.objects.create(text=f"Пост {number}",
+                                       author=self.author,
+                                       group=self.group)
+            Comment.objects.create(post=post, author=self.user,
+                                   text="Комментарий")
+
+    def count_queries(self, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.auth_client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_feed_queries_do_not_depend_on_post_count(self):
+        self.create_posts(1)
+        single = {name: self.count_queries(url)
+                  for name, url in self.urls.items()}
+        self.create_posts(4)
+        for name, url in self.urls.items():
+            with self.subTest(view=name):
+                self.assertEqual(self.count_queries(url), single[name])
+
+    def test_card_shows_comment_count(self):
+        self.create_posts(1)
+        response = self.auth_client.get(self.urls['profile'])
+        self.assertContains(response, "1 комментариев")
+
+
+class CursorPaginatorTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="MegaDen")
+        self.posts = [
+            Post.objects.create(text=f"Пост {number}", author=self.user)
+            for number in range(7)
+        ]
+        # equal pub_date values must still be ordered and paged by id
+        Post.objects.filter(id__in=[post.id for post in self.posts[2:5]]
+                            ).update(pub_date=self.posts[2].pub_date)
+        self.expected = list(Post.objects.order_by('-pub_date', '-id'))
+
+    def test_pages_forward_and_backward(self):
+        paginator = CursorPaginator(Post.objects.all(), 3)
+        pages = [paginator.page()]
+        while pages[-1].has_next():
+            pages.append(paginator.page(after=pages[-1].next_cursor))
+        walked = [post for page in pages for post in page]
+        self.assertEqual(walked, self.expected)
+        self.assertFalse(pages[0].has_previous())
+
+        previous = paginator.page(before=pages[-1].previous_cursor)
+        self.assertEqual(list(previous), list(pages[-2]))
+        first = paginator.page(before=pages[1].previous_cursor)
+        self.assertEqual(list(first), list(pages[0]))
+        self.assertFalse(first.has_previous())
+
+    def test_bad_cursor_falls_back_to_first_page(self):
+        paginator = CursorPaginator(Post.objects.all(), 3)
+        page = paginator.get_page(after='garbage')
+        self.assertEqual(list(page), self.expected[:3])
+
+    @override_settings(FEED_PAGINATION='cursor')
+    def test_profile_in_cursor_mode(self):
+        url = reverse('profile', kwargs={'username': self.user.username})
+        response = self.client.get(url)
+        page = response.context['page']
+        self.assertEqual(list(page), self.expected[:5])
+        self.assertContains(response, f'?after={page.next_cursor}')
+
+        response = self.client.get(url, {'after': page.next_cursor})
+        self.assertEqual(list(response.context['page']), self.expected[5:])
+
+
+class TimelineTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="MegaDen")
+        self.author = User.objects.create_user(username="Fedun")
+        self.old_post = Post.objects.create(text="Старый пост",
+                                            author=self.author)
+        self.auth_client = Client()
+        self.auth_client.force_login(self.user)
+
+    def feed(self):
+        response = self.auth_client.get(reverse('follow_index'))
+        return [post.text for post in response.context['page']]
+
+    def test_timeline_follows_subscriptions(self):
+        Follow.objects.create(user=self.user, author=self.author)
+        Post.objects.create(text="Новый пост", author=self.author)
+        self.assertEqual(self.feed(), ["Новый пост", "Старый пост"])
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=self.user).count(), 2)
+
+        self.auth_client.get(reverse('profile_unfollow',
+                                     kwargs={'username': 'Fedun'}))
+        self.assertEqual(self.feed(), [])
+        self.assertFalse(TimelineEntry.objects.exists())
+
+    @override_settings(FEED_FANOUT_MAX_FOLLOWERS=0)
+    def test_popular_authors_are_merged_on_read(self):
+        cache.clear()
+        Follow.objects.create(user=self.user, author=self.author)
+        Post.objects.create(text="Новый пост", author=self.author)
+        self.assertFalse(TimelineEntry.objects.exists())
+        self.assertEqual(self.feed(), ["Новый пост", "Старый пост"])
+
+    def test_backfill_command(self):
+        Follow.objects.create(user=self.user, author=self.author)
+        TimelineEntry.objects.all().delete()
+        call_command('backfill_timelines', stdout=io.StringIO())
+        self.assertEqual(self.feed(), ["Старый пост"])
+
+    @override_settings(FEED_PAGINATION='cursor')
+    def test_follow_index_in_cursor_mode(self):
+        Follow.objects.create(user=self.user, author=self.author)
+        for number in range(11):
+            Post.objects.create(text=f"Пост {number}", author=self.author)
+        response = self.auth_client.get(reverse('follow_index'))
+        page = response.context['page']
+        self.assertEqual(len(page), 10)
+        response = self.auth_client.get(reverse('follow_index'),
+                                        {'after': page.next_cursor})
+        self.assertEqual([post.text for post in response.context['page']],
+                         ["Пост 0", "Старый пост"])
+
+
+class CountersTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="MegaDen")
+        self.author = User.objects.create_user(username="Fedun")
+
+    def stats(self, user):
+        return UserStats.objects.values_list(
+            'followers_count', 'following_count', 'posts_count'
+        ).get(user=user)
+
+    def test_counters_follow_writes_and_cascades(self):
+        follow = Follow.objects.create(user=self.user, author=self.author)
+        post = Post.objects.create(text="Пост", author=self.author)
+        Comment.objects.create(post=post, author=self.user, text="Коммент")
+        comment = Comment.objects.create(post=post, author=self.author,
+                                         text="Ответ")
+        self.assertEqual(self.stats(self.author), (1, 0, 1))
+        self.assertEqual(self.stats(self.user), (0, 1, 0))
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 2)
+
+        comment.delete()
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 1)
+        follow.delete()
+        self.assertEqual(self.stats(self.author), (0, 0, 1))
+        self.assertEqual(self.stats(self.user), (0, 0, 0))
+
+        Follow.objects.create(user=self.author, author=self.user)
+        self.author.delete()
+        self.assertEqual(self.stats(self.user), (0, 0, 0))
+
+    def test_post_delete_skips_work_for_its_comments(self):
+        post = Post.objects.create(text="Пост", author=self.author)
+        other = Post.objects.create(text="Другой", author=self.user)
+        for number in range(3):
+            Comment.objects.create(post=post, author=self.user,
+                                   text=f"Коммент {number}")
+        Comment.objects.create(post=other, author=self.author, text="Ответ")
+        run_pending()
+        with CaptureQueriesContext(connection) as queries:
+            post.delete()
+        self.assertFalse(any('"comment_count"' in query['sql']
+                             for query in queries))
+        self.assertFalse(Task.objects.filter(status=Task.PENDING).exists())
+        # comments of the author's on other posts still count
+        self.author.delete()
+        other.refresh_from_db()
+        self.assertEqual(other.comment_count, 0)
+        self.assertEqual(run_pending(), 1)
+
+    def test_profile_header_without_aggregates(self):
+        Post.objects.create(text="Пост", author=self.author)
+        Follow.objects.create(user=self.user, author=self.author)
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                reverse('profile', kwargs={'username': 'Fedun'}))
+        self.assertContains(response, "Подписчиков: 1")
+        self.assertContains(response, "Записей: 1")
+        header_counts = [query['sql'] for query in queries
+                         if 'COUNT(' in query['sql']
+                         and 'posts_post' not in query['sql']]
+        self.assertEqual(header_counts, [])
+
+    def test_reconcile_command_repairs_drift(self):
+        post = Post.objects.create(text="Пост", author=self.author)
+        Comment.objects.create(post=post, author=self.user, text="Коммент")
+        UserStats.objects.filter(user=self.author).update(posts_count=7)
+        Post.objects.filter(id=post.id).update(comment_count=0)
+        UserStats.objects.filter(user=self.user).delete()
+
+        call_command('reconcile_counters', stdout=io.StringIO())
+        self.assertEqual(self.stats(self.author), (0, 0, 1))
+        self.assertEqual(self.stats(self.user), (0, 0, 0))
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 1)
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN')
+class QueryPlanTest(TestCase):
+    table_scan = re.compile(r'^SCAN (TABLE )?posts_\w+( AS \w+)?$')
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="MegaDen")
+        self.author = User.objects.create_user(username="Fedun")
+        self.group = Group.objects.create(title='RadioFM', slug='radiofm',
+                                          description='Только новая музыка')
+        Follow.objects.create(user=self.user, author=self.author)
+        for number in range(3):
+            self.post = Post.objects.create(text=f"Пост {number}",
+                                            author=self.author,
+                                            group=self.group)
+            Comment.objects.create(post=self.post, author=self.user,
+                                   text="Комментарий")
+        self.client.force_login(self.user)
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            return [row[-1] for row in cursor.fetchall()]
+
+    def assert_indexed(self, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        for query in queries:
+            sql = query['sql']
+            if not sql.startswith('SELECT') or 'posts_' not in sql:
+                continue
+            for detail in self.explain(sql):
+                self.assertIsNone(self.table_scan.match(detail),
+                                  f'{detail}: {sql}')
+                self.assertNotIn('TEMP B-TREE', detail, sql)
+
+    def test_feeds_use_indexes(self):
+        urls = {
+            'index': reverse('index'),
+            'profile': reverse('profile', kwargs={'username': 'Fedun'}),
+            'group_posts': reverse('group_posts', kwargs={'slug': 'radiofm'}),
+            'post': reverse('post', kwargs={'username': 'Fedun',
+                                            'post_id': self.post.id}),
+            'follow_index': reverse('follow_index'),
+        }
+        for name, url in urls.items():
+            with self.subTest(view=name):
+                self.assert_indexed(url)
+
+    @override_settings(FEED_PAGINATION='cursor')
+    def test_cursor_pages_use_indexes(self):
+        page = CursorPaginator(Post.objects.all(), 1).page()
+        self.assert_indexed(reverse('index') + f'?after={page.next_cursor}')
+
+
+class PostCardCacheTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="MegaDen")
+        self.group = Group.objects.create(title='RadioFM', slug='radiofm',
+                                          description='Только новая музыка')
+        self.post = Post.objects.create(text="Исходный текст",
+                                        author=self.user, group=self.group)
+        self.profile_url = reverse('profile',
+                                   kwargs={'username': 'MegaDen'})
+
+    def test_card_rendered_once_is_shared_between_feeds(self):
+        self.client.get(self.profile_url)
+        Post.objects.filter(id=self.post.id).update(text="Тайком")
+        for url in (reverse('index'), self.profile_url,
+                    reverse('group_posts', kwargs={'slug': 'radiofm'})):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertContains(response, "Исходный текст")
+
+    def test_card_invalidated_by_post_and_group_changes(self):
+        self.client.get(self.profile_url)
+        self.post.text = "Новый текст"
+        self.post.save()
+        self.assertContains(self.client.get(self.profile_url), "Новый текст")
+
+        self.group.description = "Только старая музыка"
+        self.group.save()
+        self.assertContains(self.client.get(self.profile_url),
+                            "Только старая музыка")
+
+    def test_comment_count_is_not_cached(self):
+        self.client.force_login(self.user)
+        self.client.get(self.profile_url)
+        Comment.objects.create(post=self.post, author=self.user,
+                               text="Комментарий")
+        self.assertContains(self.client.get(self.profile_url),
+                            "1 комментариев")
+
+
+class AnonymousPageCacheTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="MegaDen")
+        self.author = User.objects.create_user(username="Fedun")
+        self.group = Group.objects.create(title='RadioFM', slug='radiofm',
+                                          description='Только новая музыка')
+        self.post = Post.objects.create(text="Первый пост",
+                                        author=self.author, group=self.group)
+        self.urls = {
+            'group_posts': reverse('group_posts', kwargs={'slug': 'radiofm'}),
+            'profile': reverse('profile', kwargs={'username': 'Fedun'}),
+            'post': reverse('post', kwargs={'username': 'Fedun',
+                                            'post_id': self.post.id}),
+        }
+
+    def test_anonymous_pages_are_cached(self):
+        for name, url in self.urls.items():
+            with self.subTest(view=name):
+                self.assertIsNotNone(self.client.get(url).context)
+                self.assertIsNone(self.client.get(url).context)
+
+    def test_writes_invalidate_anonymous_pages(self):
+        for url in self.urls.values():
+            self.client.get(url)
+
+        Post.objects.create(text="Второй пост", author=self.author,
+                            group=self.group)
+        self.assertContains(self.client.get(self.urls['group_posts']),
+                            "Второй пост")
+        self.assertContains(self.client.get(self.urls['profile']),
+                            "Записей: 2")
+
+        Comment.objects.create(post=self.post, author=self.user,
+                               text="Новый комментарий")
+        self.assertContains(self.client.get(self.urls['post']),
+                            "Новый комментарий")
+
+        Follow.objects.create(user=self.user, author=self.author)
+        self.assertContains(self.client.get(self.urls['post']),
+                            "Подписчиков: 1")
+
+        self.group.description = "Только старая музыка"
+        self.group.save()
+        self.assertContains(self.client.get(self.urls['profile']),
+                            "Только старая музыка")
+
+    def test_evicted_generation_does_not_revive_old_pages(self):
+        cache.clear()
+        self.client.get(self.urls['profile'])
+        Post.objects.create(text="Второй пост", author=self.author)
+        self.assertContains(self.client.get(self.urls['profile']),
+                            "Второй пост")
+        # the generation counters are evicted, the stale page is not
+        cache.delete_many([GENERATION_KEY.format(scope) for scope in
+                           (SITE_SCOPE, 'profile:Fedun')])
+        self.assertContains(self.client.get(self.urls['profile']),
+                            "Второй пост")
+
+    def test_moving_post_invalidates_old_group(self):
+        self.client.get(self.urls['group_posts'])
+        self.post.group = Group.objects.create(title='Musictv',
+                                               slug='musictv',
+                                               description='Канал')
+        self.post.save()
+        self.assertNotContains(self.client.get(self.urls['group_posts']),
+                               "Первый пост")
+
+    def test_authenticated_page_is_rendered_per_user(self):
+        self.client.get(self.urls['profile'])
+        self.client.force_login(self.user)
+        response = self.client.get(self.urls['profile'])
+        self.assertIsNotNone(response.context)
+        self.assertContains(response, "Подписаться")
+
+
+class PostImagesTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.media = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(
+            MEDIA_ROOT=self.media.name)
+        self.settings_override.enable()
+        self.user = User.objects.create_user(username="MegaDen")
+        self.client.force_login(self.user)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.media.cleanup()
+
+    def upload(self, size=(1000, 1000), exif=None):
+        byte_image = io.BytesIO()
+        Image.new("RGB", size=size, color=(255, 0, 0)).save(
+            byte_image, format='jpeg', exif=exif or Image.Exif())
+        image = ContentFile(byte_image.getvalue(), name='test.jpeg')
+        self.client.post(reverse('new_post'),
+                         data={"text": "Пост с картинкой", "image": image})
+        return Post.objects.get()
+
+    def test_image_processed_in_background(self):
+        post = self.upload()
+        self.assertFalse(post.card_image)
+        self.assertEqual(Task.objects.get(
+            name='process_post_image').status, Task.PENDING)
+        response = self.client.get(
+            reverse('profile', kwargs={'username': 'MegaDen'}))
+        self.assertContains(response, 'Изображение обрабатывается')
+
+        # the image and the search index of the new post
+        self.assertEqual(run_pending(), 2)
+        post.refresh_from_db()
+        self.assertEqual(Task.objects.get(
+            name='process_post_image').status, Task.DONE)
+        with Image.open(post.card_image.path) as card:
+            self.assertEqual(card.size, (960, 339))
+        response = self.client.get(
+            reverse('profile', kwargs={'username': 'MegaDen'}))
+        self.assertContains(response, post.card_image.url)
+
+    def test_exif_orientation_is_applied(self):
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        post = self.upload(size=(200, 100), exif=exif)
+        run_pending()
+        post.refresh_from_db()
+        with Image.open(post.image.path) as image:
+            self.assertEqual(image.size, (100, 200))
+            self.assertNotIn(0x0112, image.getexif())
+
+    def test_failed_task_is_retried(self):
+        post = self.upload()
+        os.remove(post.image.path)
+        with self.assertLogs('posts.tasks', 'ERROR'):
+            run_pending()
+        task = Task.objects.get(name='process_post_image')
+        self.assertEqual((task.status, task.attempts), (Task.PENDING, 1))
+        self.assertIn('Error', task.error)
+
+    def test_feed_rendering_does_not_open_images(self):
+        post = self.upload()
+        run_pending()
+        post.refresh_from_db()
+        with mock.patch('PIL.Image.open') as image_open:
+            response = self.client.get(
+                reverse('profile', kwargs={'username': 'MegaDen'}))
+        image_open.assert_not_called()
+        self.assertContains(response, post.card_image.url)
+
+    def test_card_variants_in_picture(self):
+        post = self.upload()
+        run_pending()
+        post.refresh_from_db()
+        sources = {source['type']: source['srcset']
+                   for source in post.card_sources}
+        self.assertIn('image/webp', sources)
+        self.assertIn('480w', sources['image/webp'])
+        for name in re.findall(r'/media/(\S+) \d+w', sources['image/webp']):
+            with Image.open(os.path.join(self.media.name, name)) as card:
+                self.assertEqual(card.format, 'WEBP')
+        response = self.client.get(
+            reverse('profile', kwargs={'username': 'MegaDen'}))
+        self.assertContains(response, '<source type="image/webp"')
+        self.assertContains(response, sources['image/webp'])
+
+    def test_render_cards_keeps_original(self):
+        post = self.upload()
+        run_pending()
+        post.refresh_from_db()
+        with open(post.image.path, 'rb') as original:
+            content = original.read()
+        call_command('render_cards', stdout=io.StringIO())
+        self.assertEqual(run_pending(), 1)
+        rendered = Post.objects.get()
+        self.assertEqual(rendered.image.name, post.image.name)
+        with open(rendered.image.path, 'rb') as original:
+            self.assertEqual(original.read(), content)
+        # same original, same cards: content-addressed names are reused
+        self.assertEqual(rendered.card_variants, post.card_variants)
+
+    def test_upload_is_not_decoded_in_request(self):
+        with mock.patch('PIL.ImageFile.ImageFile.load') as load:
+            self.upload()
+        load.assert_not_called()
+
+    @override_settings(POST_IMAGE_MAX_SIDE=300)
+    def test_large_original_is_downsized(self):
+        post = self.upload(size=(1000, 500))
+        run_pending()
+        post.refresh_from_db()
+        with Image.open(post.image.path) as image:
+            self.assertEqual(image.size, (300, 150))
+
+    def assertRejected(self, size, error):
+        byte_image = io.BytesIO()
+        Image.effect_noise(size, 64).save(byte_image, format='jpeg')
+        image = ContentFile(byte_image.getvalue(), name='test.jpeg')
+        response = self.client.post(
+            reverse('new_post'),
+            data={"text": "Пост с картинкой", "image": image})
+        self.assertFormError(response, 'form', 'image', error)
+        self.assertFalse(Post.objects.exists())
+
+    @override_settings(POST_IMAGE_MAX_PIXELS=1000 * 1000)
+    def test_too_many_pixels_rejected(self):
+        self.assertRejected((1200, 1000), 'Изображение больше 1 мегапикселей.')
+
+    @override_settings(POST_IMAGE_MAX_BYTES=1024)
+    def test_too_large_file_rejected(self):
+        self.assertRejected((200, 200), 'Файл больше 1,0\xa0КБ.')
+
+
+class MediaStorageTest(TestCase):
+
+    def setUp(self):
+        self.media = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(
+            MEDIA_ROOT=self.media.name)
+        self.settings_override.enable()
+        self.user = User.objects.create_user(username="MegaDen")
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.media.cleanup()
+
+    def create_post(self, content=b'GIF89a', name='image.gif'):
+        return Post.objects.create(text='Пост', author=self.user,
+                                   image=ContentFile(content, name=name))
+
+    def files(self):
+        return sorted(
+            os.path.relpath(os.path.join(path, name), self.media.name)
+            for path, _, names in os.walk(self.media.name) for name in names)
+
+    def test_identical_uploads_stored_once(self):
+        first = self.create_post(name='first.GIF')
+        second = self.create_post(name='second.gif')
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertRegex(first.image.name, r'^posts/(\w\w)/\1\w{30}\.gif$')
+        self.assertEqual(self.files(), [first.image.name])
+        self.assertNotEqual(self.create_post(b'GIF87a').image.name,
+                            first.image.name)
+
+    def test_gc_removes_only_old_unreferenced_files(self):
+        kept = self.create_post(b'kept').image.name
+        orphan = self.create_post(b'orphan')
+        orphan_name = orphan.image.name
+        orphan.delete()
+        fresh = self.create_post(b'fresh')
+        fresh_name = fresh.image.name
+        fresh.delete()
+        long_ago = time.time() - 2 * 24 * 3600
+        for name in (kept, orphan_name):
+            os.utime(os.path.join(self.media.name, name),
+                     (long_ago, long_ago))
+
+        out = io.StringIO()
+        call_command('gc_media', '--dry-run', stdout=out)
+        self.assertIn(orphan_name, out.getvalue())
+        self.assertEqual(len(self.files()), 3)
+
+        call_command('gc_media', stdout=io.StringIO())
+        self.assertEqual(self.files(), sorted([kept, fresh_name]))
+
+
+class SearchMixin:
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="MegaDen")
+        self.reader = User.objects.create_user(username="reader")
+
+    def search(self, query, page=None):
+        data = {'q': query}
+        if page:
+            data['page'] = page
+        response = self.client.get(reverse('search'), data)
+        return [post.text for post in response.context['page']]
+
+    def post(self, text):
+        post = Post.objects.create(text=text, author=self.user)
+        run_pending()
+        return post
+
+    def test_russian_stemming(self):
+        self.assertEqual(stem('футболом'), 'футбол')
+        self.post('Вечером играли в футбол')
+        self.post('Читали книги')
+        self.assertEqual(self.search('футболом'),
+                         ['Вечером играли в футбол'])
+        self.assertEqual(self.search('КНИГАМИ'), ['Читали книги'])
+        self.assertEqual(self.search('футбол книги'), [])
+        self.assertEqual(self.search(''), [])
+
+    def test_index_follows_writes(self):
+        post = self.post('Пробежка по парку')
+        post.text = 'Заплыв в бассейне'
+        post.save()
+        run_pending()
+        self.assertEqual(self.search('пробежка'), [])
+        self.assertEqual(self.search('бассейн'), ['Заплыв в бассейне'])
+        comment = Comment.objects.create(post=post, author=self.reader,
+                                         text='Отличная тренировка')
+        Comment.objects.create(post=post, author=self.reader,
+                               text='Вода холодная')
+        # both comments are indexed by one task
+        self.assertEqual(run_pending(), 1)
+        self.assertEqual(self.search('тренировки'), ['Заплыв в бассейне'])
+        self.assertEqual(self.search('холодная'), ['Заплыв в бассейне'])
+        comment.delete()
+        run_pending()
+        self.assertEqual(self.search('тренировки'), [])
+        post.delete()
+        self.assertEqual(self.search('бассейн'), [])
+
+    def test_cached_results_follow_the_index(self):
+        post = self.post('Поход в зоопарк')
+        Comment.objects.create(post=post, author=self.reader,
+                               text='Видели зебру')
+        # rendered before the task has indexed the comment
+        self.assertEqual(self.search('зебра'), [])
+        run_pending()
+        self.assertEqual(self.search('зебра'), ['Поход в зоопарк'])
+
+    def test_ranking(self):
+        in_comment = self.post('Просто пост')
+        Comment.objects.create(post=in_comment, author=self.reader,
+                               text='Лыжи')
+        run_pending()
+        self.post('Лыжи, лыжи и ещё раз лыжи')
+        self.post('Новые лыжи')
+        self.assertEqual(self.search('лыжи'), [
+            'Лыжи, лыжи и ещё раз лыжи', 'Новые лыжи', 'Просто пост'])
+
+    def test_paging_keeps_query(self):
+        for number in range(12):
+            self.post(f'Марафон номер {number}')
+        self.post('Другое')
+        self.assertEqual(len(self.search('марафон')), 10)
+        self.assertEqual(len(self.search('марафон', page=2)), 2)
+        response = self.client.get(reverse('search'), {'q': 'марафон'})
+        self.assertContains(response, 'href="?q=%D0%BC%D0%B0%D1%80%D0%B0'
+                                      '%D1%84%D0%BE%D0%BD&amp;page=2"')
+
+    def test_rebuild(self):
+        self.post('Велосипед')
+        get_index().clear()
+        self.assertEqual(self.search('велосипед'), [])
+        call_command('rebuild_search_index', stdout=io.StringIO())
+        self.assertEqual(self.search('велосипед'), ['Велосипед'])
+
+
+@override_settings(SEARCH_BACKEND='fts5')
+class FTS5SearchTest(SearchMixin, TestCase):
+
+    def setUp(self):
+        if not fts5_available():
+            self.skipTest('SQLite without FTS5')
+        super().setUp()
+        self.assertIsInstance(get_index(), FTS5Index)
+
+
+@override_settings(SEARCH_BACKEND='postings')
+class PostingSearchTest(SearchMixin, TestCase):
+    pass
+
+
+class AdminChangelistTest(TestCase):
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='secret')
+        self.client.force_login(self.admin)
+        self.group = Group.objects.create(title='Бег', slug='run',
+                                          description='Бег')
+
+    def add_rows(self, count):
+        start = User.objects.count()
+        for number in range(start, start + count):
+            author = User.objects.create_user(username=f'author{number}')
+            post = Post.objects.create(text='Пост', author=author,
+                                       group=self.group)
+            Comment.objects.create(post=post, author=author, text='Ответ')
+            Follow.objects.create(user=self.admin, author=author)
+
+    def test_query_count_does_not_grow_with_rows(self):
+        urls = [reverse(f'admin:posts_{model}_changelist')
+                for model in ('post', 'comment', 'follow')]
+        self.add_rows(2)
+        queries = []
+        for url in urls:
+            with CaptureQueriesContext(connection) as context:
+                self.assertEqual(self.client.get(url).status_code, 200)
+            queries.append(len(context))
+        self.add_rows(5)
+        for url, expected in zip(urls, queries):
+            with self.subTest(url=url):
+                with self.assertNumQueries(expected):
+                    self.client.get(url)
+
+    def test_estimated_count(self):
+        self.add_rows(3)
+        Post.objects.filter(author__username='author1').delete()
+        with mock.patch.object(EstimatedCountPaginator, 'EXACT_BELOW', 0):
+            # the largest id: deleted rows are still counted
+            self.assertEqual(
+                EstimatedCountPaginator(Post.objects.all(), 10).count, 3)
+            self.assertEqual(EstimatedCountPaginator(
+                Post.objects.filter(group=self.group), 10).count, 2)
+        self.assertEqual(
+            EstimatedCountPaginator(Post.objects.all(), 10).count, 2)
+
+    def test_estimate_uses_sqlite_statistics(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('SQLite only')
+        self.add_rows(3)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        # the largest id would give 2
+        Post.objects.order_by('-id').first().delete()
+        # posts_post has indexes, so ANALYZE leaves one row per index
+        self.assertEqual(estimate_count(Post), 3)
+
+    def test_changelist_shows_excerpt(self):
+        long_text = 'Очень длинный пост ' * 1000
+        post = Post.objects.create(text=long_text, author=self.admin)
+        self.assertEqual(post.excerpt, make_excerpt(long_text))
+        self.assertLessEqual(len(post.excerpt), 300)
+        self.assertTrue(post.excerpt.endswith(' [...]'))
+        Comment.objects.create(post=post, author=self.admin, text='Ответ')
+        for model in ('post', 'comment'):
+            with self.subTest(model=model):
+                response = self.client.get(
+                    reverse(f'admin:posts_{model}_changelist'))
+                self.assertContains(response, post.excerpt)
+                self.assertNotContains(response, long_text[:1000])
+
+
+class PostExcerptTest(TestCase):
+
+    def test_make_excerpt(self):
+        self.assertEqual(make_excerpt('Короткий   пост'), 'Короткий пост')
+        text = 'слово ' * 100
+        self.assertEqual(make_excerpt(text), textwrap.shorten(text, 300))
+        self.assertEqual(make_excerpt('x' * 1000), 'x' * 294 + ' [...]')
+
+    def test_whitespace_is_collapsed_before_cutting(self):
+        # longer than the excerpt, but not once the spaces are collapsed
+        text = 'Начало' + ' ' * 1000 + 'конец'
+        self.assertEqual(make_excerpt(text), 'Начало конец')
+        text = ('слово' + ' \n' * 100) * 60
+        self.assertEqual(make_excerpt(text), textwrap.shorten(text, 300))
+
+    def test_long_word_is_cut(self):
+        url = 'https://example.com/' + 'a' * 400
+        for text in (url, url + ' ссылка', '  ' + url + '\nссылка'):
+            with self.subTest(text=text[-10:]):
+                self.assertEqual(make_excerpt(text), url[:294] + ' [...]')
+        user = User.objects.create_user(username='MegaDen')
+        post = Post.objects.create(text=url + ' ссылка', author=user)
+        self.assertEqual(str(post), url[:294] + ' [...]')
+        with mock.patch('textwrap.shorten', return_value=''):
+            self.assertEqual(make_excerpt(url + ' ссылка'),
+                             url[:294] + ' [...]')
+
+    def test_str_does_not_load_text(self):
+        user = User.objects.create_user(username='MegaDen')
+        post = Post.objects.create(text='Пост ' * 500, author=user)
+        post.text = 'Новый текст'
+        post.save()
+        post = Post.objects.defer('text').get()
+        with self.assertNumQueries(0):
+            self.assertEqual(str(post), 'Новый текст')
+
+
+class TransferTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="MegaDen")
+        self.author = User.objects.create_user(username="Fedun")
+        group = Group.objects.create(title="RadioFM", slug="radiofm",
+                                     description="Только новая музыка")
+        self.post = Post.objects.create(text="Старый пост про лыжи",
+                                        author=self.author, group=group)
+        Post.objects.filter(id=self.post.id).update(
+            pub_date=self.post.pub_date.replace(year=2015))
+        Comment.objects.create(post=self.post, author=self.user,
+                               text="Коммент")
+        Follow.objects.create(user=self.user, author=self.author)
+
+    def snapshot(self):
+        return {
+            'posts': list(Post.objects.values_list(
+                'id', 'pub_date', 'author__username', 'group__slug', 'text',
+                'excerpt', 'comment_count')),
+            'comments': list(Comment.objects.values_list(
+                'post_id', 'author__username', 'created', 'text')),
+            'stats': list(UserStats.objects.order_by(
+                'user__username').values_list(
+                'user__username', 'followers_count', 'following_count',
+                'posts_count')),
+            'timelines': list(TimelineEntry.objects.values_list(
+                'user__username', 'post_id')),
+        }
+
+    def round_trip(self, data_format):
+        before = self.snapshot()
+        with tempfile.TemporaryDirectory() as temp_directory:
+            path = os.path.join(temp_directory, 'export')
+            call_command('export_data', path, '--format', data_format,
+                         stdout=io.StringIO())
+            User.objects.all().delete()
+            Group.objects.all().delete()
+            self.assertFalse(Post.objects.exists())
+            call_command('import_data', path, '--format', data_format,
+                         '--batch-size', '2', stdout=io.StringIO())
+        self.assertEqual(self.snapshot(), before)
+        self.assertFalse(User.objects.get(
+            username="Fedun").has_usable_password())
+        response = self.client.get(reverse('search'), {'q': 'лыжи'})
+        self.assertEqual([post.text for post in response.context['page']],
+                         ["Старый пост про лыжи"])
+
+    def test_jsonl_round_trip(self):
+        self.round_trip('jsonl')
+
+    def test_csv_round_trip(self):
+        self.round_trip('csv')
+
+    def test_import_is_batched(self):
+        with tempfile.TemporaryDirectory() as temp_directory:
+            path = os.path.join(temp_directory, 'export.jsonl')
+            with open(path, 'w') as output:
+                for number in range(10):
+                    output.write(json.dumps({
+                        'model': 'post', 'id': 100 + number,
+                        'pub_date': '2015-01-01T00:00:00+00:00',
+                        'author': 'Fedun', 'text': f'Пост {number}'}) + '\n')
+            with CaptureQueriesContext(connection) as queries:
+                call_command('import_data', path, '--batch-size', '5',
+                             stdout=io.StringIO())
+        inserts = [query['sql'] for query in queries
+                   if query['sql'].startswith('INSERT')
+                   and 'INTO "posts_post" ' in query['sql']]
+        self.assertEqual(len(inserts), 2)
+        self.assertEqual(Post.objects.filter(
+            pub_date__year=2015, author=self.author).count(), 11)
+
+    def test_import_into_database_with_same_ids(self):
+        with tempfile.TemporaryDirectory() as temp_directory:
+            path = os.path.join(temp_directory, 'export.jsonl')
+            call_command('export_data', path, stdout=io.StringIO())
+            # another site: a different post has the exported post's id
+            Comment.objects.all().delete()
+            Post.objects.filter(id=self.post.id).update(text="Чужой пост")
+            output = io.StringIO()
+            call_command('import_data', path, stdout=output)
+            self.assertIn("post: 1, comment: 1", output.getvalue())
+            imported = Post.objects.get(text="Старый пост про лыжи")
+            self.assertNotEqual(imported.id, self.post.id)
+            self.assertEqual(list(imported.comments.values_list(
+                'text', flat=True)), ["Коммент"])
+            self.assertFalse(Comment.objects.filter(
+                post_id=self.post.id).exists())
+
+            # running the same import again inserts nothing
+            output = io.StringIO()
+            call_command('import_data', path, stdout=output)
+            self.assertIn("post: 0, comment: 0", output.getvalue())
+            self.assertIn(
+                "Пропущено: group: 1, post: 1, comment: 1, follow: 1",
+                output.getvalue())
+        self.assertEqual(Post.objects.count(), 2)
+        self.assertEqual(Comment.objects.count(), 1)
+
+    def test_comments_of_missing_posts_are_skipped(self):
+        with tempfile.TemporaryDirectory() as temp_directory:
+            path = os.path.join(temp_directory, 'export.jsonl')
+            call_command('export_data', path, '--models', 'comment',
+                         stdout=io.StringIO())
+            output = io.StringIO()
+            call_command('import_data', path, stdout=output)
+        self.assertIn("Пропущено: comment: 1", output.getvalue())
+        self.assertEqual(Comment.objects.count(), 1)
+
+    def test_finish_refreshes_imported_rows_only(self):
+        reader = User.objects.create_user(username="reader")
+        Follow.objects.create(user=reader, author=self.user)
+        Post.objects.create(text="Пост про лыжи", author=self.user)
+        run_pending()
+        get_index().clear()
+        TimelineEntry.objects.all().delete()
+        with tempfile.TemporaryDirectory() as temp_directory:
+            path = os.path.join(temp_directory, 'export.jsonl')
+            with open(path, 'w') as output:
+                output.write(json.dumps({
+                    'model': 'post', 'id': 100,
+                    'pub_date': '2015-01-01T00:00:00+00:00',
+                    'author': 'Fedun', 'text': 'Новые лыжи'}) + '\n')
+            call_command('import_data', path, stdout=io.StringIO())
+        response = self.client.get(reverse('search'), {'q': 'лыжи'})
+        self.assertEqual([post.text for post in response.context['page']],
+                         ["Новые лыжи"])
+        # only followers of Fedun, who has a new post, are backfilled
+        self.assertEqual(set(TimelineEntry.objects.values_list(
+            'user__username', 'post__text')), {
+            ("MegaDen", "Старый пост про лыжи"),
+            ("MegaDen", "Новые лыжи")})
+
+
+class LoadProfileTest(TestCase):
+
+    def test_generate_and_bench(self):
+        call_command('generate_data', '--users', '50', '--posts', '200',
+                     '--comments', '50', '--groups', '3', '--follows', '5',
+                     stdout=io.StringIO())
+        self.assertEqual(Post.objects.count(), 200)
+        self.assertEqual(Group.objects.count(), 3)
+        followers = sorted(UserStats.objects.values_list(
+            'followers_count', flat=True), reverse=True)
+        self.assertEqual(sum(followers), Follow.objects.count())
+        # a few popular authors, a long tail
+        self.assertGreater(followers[0], 4 * followers[len(followers) // 2])
+        self.assertTrue(TimelineEntry.objects.exists())
+
+        with tempfile.TemporaryDirectory() as temp_directory:
+            path = os.path.join(temp_directory, 'result.json')
+            call_command('bench_feeds', '--requests', '3', '--output', path,
+                         stdout=io.StringIO())
+            out = io.StringIO()
+            call_command('bench_feeds', '--requests', '3', '--output', path,
+                         '--compare', path, stdout=out)
+            with open(path) as file:
+                result = json.load(file)
+        self.assertEqual(result['posts'], 200)
+        self.assertEqual(list(result['views']), [
+            'index', 'group_posts', 'profile', 'post_view', 'follow_index'])
+        for numbers in result['views'].values():
+            self.assertGreater(numbers['queries'], 0)
+            self.assertLessEqual(numbers['p50_ms'], numbers['p99_ms'])
+        self.assertIn('(+0)', out.getvalue())
+
+
+class FollowTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="MegaDen")
+        self.author = User.objects.create_user(username="Fedun")
+        Post.objects.create(text="Пост", author=self.author)
+        self.auth_client = Client()
+        self.auth_client.force_login(self.user)
+
+    def stats(self, user):
+        return UserStats.objects.values_list(
+            'followers_count', 'following_count').get(user=user)
+
+    def request(self, action, username='Fedun'):
+        return self.auth_client.get(
+            reverse(f'profile_{action}', kwargs={'username': username}))
+
+    def test_follow_is_idempotent(self):
+        self.request('follow')
+        # a repeated click costs the author lookup and the insert
+        self.request('follow')
+        with CaptureQueriesContext(connection) as queries:
+            self.request('follow')
+        follow_queries = [query['sql'] for query in queries
+                          if 'posts_follow' in query['sql']]
+        self.assertEqual(len(follow_queries), 1)
+        self.assertEqual(Follow.objects.count(), 1)
+        self.assertEqual(self.stats(self.author), (1, 0))
+        self.assertEqual(self.stats(self.user), (0, 1))
+        self.assertEqual(TimelineEntry.objects.count(), 1)
+
+        self.request('unfollow')
+        self.request('unfollow')
+        self.assertFalse(Follow.objects.exists())
+        self.assertEqual(self.stats(self.author), (0, 0))
+        self.assertEqual(self.stats(self.user), (0, 0))
+        self.assertFalse(TimelineEntry.objects.exists())
+
+    def statements(self, action):
+        with CaptureQueriesContext(connection) as queries:
+            result = action(self.user, self.author.id, 'Fedun')
+        return result, [query['sql'] for query in queries
+                        if not query['sql'].startswith(('SAVEPOINT',
+                                                        'RELEASE'))]
+
+    def test_constant_queries(self):
+        changed, followed = self.statements(follow)
+        self.assertTrue(changed)
+        unfollowed = self.statements(unfollow)[1]
+        for number in range(5):
+            reader = User.objects.create_user(username=f"reader{number}")
+            follow(reader, self.author.id, 'Fedun')
+        self.assertEqual(len(self.statements(follow)[1]), len(followed))
+        changed, inserted = self.statements(follow)
+        self.assertFalse(changed)
+        self.assertEqual(len(inserted), 1)
+        self.assertTrue(inserted[0].startswith('INSERT'))
+        self.assertEqual(len(self.statements(unfollow)[1]), len(unfollowed))
+        changed, deleted = self.statements(unfollow)
+        self.assertFalse(changed)
+        self.assertEqual(len(deleted), 1)
+
+    def test_self_and_unknown_users(self):
+        self.request('follow', 'MegaDen')
+        self.assertFalse(Follow.objects.exists())
+        self.assertEqual(self.request('follow', 'nobody').status_code, 404)
+        self.assertEqual(self.request('unfollow', 'nobody').status_code, 404)
+
+
+class FollowedAuthorsTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="MegaDen")
+        self.authors = [User.objects.create_user(username=f"author{number}")
+                        for number in range(10)]
+        for author in self.authors[:3]:
+            Follow.objects.create(user=self.user, author=author)
+
+    def followed(self):
+        request = RequestFactory().get('/')
+        request.user = self.user
+        return followed_authors(request)
+
+    def test_one_query_for_any_number_of_authors(self):
+        with self.assertNumQueries(1):
+            followed = self.followed()
+            self.assertEqual([author in followed for author in self.authors],
+                             [True] * 3 + [False] * 7)
+            self.assertIn(self.authors[0].id, followed)
+        # the next request reads the cached ids
+        with self.assertNumQueries(0):
+            self.assertIn(self.authors[1], self.followed())
+
+        follow(self.user, self.authors[5].id, 'author5')
+        self.assertIn(self.authors[5], self.followed())
+        Follow.objects.get(user=self.user, author=self.authors[0]).delete()
+        self.assertNotIn(self.authors[0], self.followed())
+
+    def test_follow_button(self):
+        client = Client()
+        client.force_login(self.user)
+        post = Post.objects.create(text="Пост", author=self.authors[0])
+        response = client.get(reverse('post', kwargs={
+            'username': 'author0', 'post_id': post.id}))
+        self.assertContains(response, "Отписаться")
+        response = client.get(reverse('profile', kwargs={
+            'username': 'author9'}))
+        self.assertContains(response, "Подписаться")
+
+
+@override_settings(COMMENTS_PER_PAGE=3)
+class CommentPaginationTest(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username="Fedun")
+        self.post = Post.objects.create(text="Пост", author=self.author)
+        self.readers = [User.objects.create_user(username=f"reader{number}")
+                        for number in range(4)]
+        self.comments = [
+            Comment.objects.create(post=self.post,
+                                   author=self.readers[number % 4],
+                                   text=f"Комментарий {number}")
+            for number in range(8)]
+        self.post_url = reverse('post', kwargs={'username': 'Fedun',
+                                                'post_id': self.post.id})
+        self.comments_url = reverse('post_comments', kwargs={
+            'username': 'Fedun', 'post_id': self.post.id})
+        cache.clear()
+
+    def test_post_page_shows_first_comments(self):
+        response = self.client.get(self.post_url)
+        self.assertEqual(list(response.context['items']), self.comments[:3])
+        self.assertEqual(set(response.context['comments']),
+                         set(self.comments[:3]))
+        self.assertTrue(response.context['items'].has_next())
+        self.assertContains(response, 'data-fragment="{}?after={}"'.format(
+            self.comments_url, response.context['items'].next_cursor))
+        self.assertNotContains(response, "Комментарий 3")
+
+    def test_fragment_continues_after_cursor(self):
+        seen, after = [], None
+        while True:
+            response = self.client.get(self.comments_url,
+                                       {'after': after} if after else {})
+            self.assertEqual(response.status_code, 200)
+            self.assertTemplateUsed(response, 'includes/comment_list.html')
+            seen += list(response.context['items'])
+            after = response.context['items'].next_cursor
+            if after is None:
+                break
+        self.assertEqual(seen, self.comments)
+        self.assertNotContains(response, 'comments-more')
+
+    def test_json(self):
+        first = self.client.get(self.comments_url, {'format': 'json'}).json()
+        self.assertEqual([comment['id'] for comment in first['comments']],
+                         [comment.id for comment in self.comments[:3]])
+        self.assertEqual(first['comments'][0]['author'], 'reader0')
+        second = self.client.get(self.comments_url, {
+            'format': 'json', 'after': first['next']}).json()
+        self.assertEqual(second['comments'][0]['text'], "Комментарий 3")
+
+    def test_query_count_does_not_grow_with_comments(self):
+        def queries(url):
+            cache.clear()
+            with CaptureQueriesContext(connection) as captured:
+                self.assertEqual(self.client.get(url).status_code, 200)
+            return len(captured)
+
+        before = {url: queries(url)
+                  for url in (self.post_url, self.comments_url)}
+        for number in range(20):
+            Comment.objects.create(post=self.post, author=User.objects.create(
+                username=f"extra{number}"), text="Ещё")
+        for url, count in before.items():
+            self.assertEqual(queries(url), count, url)
+
+    def test_new_comment_shows_up_in_fragment(self):
+        response = self.client.get(self.comments_url, {'format': 'json'})
+        last = response.json()['next']
+        self.client.force_login(self.author)
+        self.client.post(reverse('add_comment', kwargs={
+            'username': 'Fedun', 'post_id': self.post.id}),
+            {'text': "Свежий комментарий"})
+        self.client.logout()
+        texts = []
+        while last:
+            page = self.client.get(self.comments_url, {
+                'format': 'json', 'after': last}).json()
+            texts += [comment['text'] for comment in page['comments']]
+            last = page['next']
+        self.assertEqual(texts[-1], "Свежий комментарий")
+
+
+class FollowConcurrencyTest(TransactionTestCase):
+
+    def test_concurrent_follow_and_unfollow(self):
+        author = User.objects.create_user(username="Fedun")
+        Post.objects.create(text="Пост", author=author)
+        users = [User.objects.create_user(username=f"reader{number}")
+                 for number in range(4)]
+        errors = []
+
+        def attempt(action, user):
+            # the shared in-memory test database refuses concurrent writes
+            # instead of waiting; the transaction is rolled back as a whole
+            while True:
+                try:
+                    return action(user, author.id, 'Fedun')
+                except OperationalError as error:
+                    if 'locked' not in str(error):
+                        raise
+
+        def hammer(user, seed):
+            try:
+                for step in range(30):
+                    # double clicks: every action is sent twice
+                    action = follow if (step + seed) % 3 else unfollow
+                    for _ in range(2):
+                        attempt(action, user)
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=hammer, args=(user, seed))
+                   for seed, user in enumerate(users * 2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+        followers = Follow.objects.filter(author=author).count()
+        self.assertEqual(UserStats.objects.get(user=author).followers_count,
+                         followers)
+        for user in users:
+            following = Follow.objects.filter(user=user).count()
+            self.assertEqual(UserStats.objects.get(
+                user=user).following_count, following)
+            self.assertEqual(TimelineEntry.objects.filter(
+                user=user).count(), following)
+
+    def test_cache_is_invalidated_after_commit(self):
+        author = User.objects.create_user(username="Fedun")
+        user = User.objects.create_user(username="reader")
+        with transaction.atomic():
+            follow(user, author.id, 'Fedun')
+            # another request, reading the committed rows, caches them
+            cache.set(FOLLOWED_KEY.format(user.id), frozenset())
+        self.assertIn(author.id, followed_author_ids(user.id))
@@ -0,0 +1,370 @@
+"""Streaming export and import of groups, posts, comments and follows.
+
+Two formats are supported:
+
+* ``jsonl``: one file, one ``{"model": ..., ...}`` object per line;
+* ``csv``: a directory with ``group.csv``, ``post.csv``, ``comment.csv``
+  and ``follow.csv``.
+
+Users are referenced by username and created (without a usable password)
+when missing. Posts keep their ids when these are free and get a new id
+when the id is taken by another post; posts already there (same author,
+date and text, e.g. from an earlier run of the same import) are not
+inserted again. Comments are attached through the resulting map of
+exported post ids, kept in a temporary table rather than in memory, so
+comments of posts missing from the import are skipped; comments already
+present (same post, author, date and text) are skipped as well.
+
+Rows are written with bulk_create, one transaction per batch; signals do
+not fire, so counters, timelines, the search index and cached pages are
+brought up to date once at the end (``finish``), for the imported rows
+only.
+"""
+import csv
+import json
+import os
+from contextlib import contextmanager
+
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max, Q
+from django.db.models.expressions import RawSQL
+from django.utils.dateparse import parse_datetime
+
+from . import counters, feeds, search, tasks
+from .cache import SITE_SCOPE, bump
+from .follows import FOLLOWED_KEY
+from .models import Comment, Follow, Group, Post, User, make_excerpt
+
+FORMATS = ('jsonl', 'csv')
+BATCH_SIZE = 1000
+# exported post id -> id of the row in this database, for one import
+POST_MAP = 'posts_import_post_map'
+
+# model name: (exported columns, rows in export order)
+EXPORTS = {
+    'group': (
+        ['slug', 'title', 'description'],
+        lambda: Group.objects.order_by('id').values_list(
+            'slug', 'title', 'description'),
+    ),
+    'post': (
+        ['id', 'pub_date', 'author', 'group', 'text', 'image', 'card_image',
+         'card_variants'],
+        lambda: Post.objects.order_by('id').values_list(
+            'id', 'pub_date', 'author__username', 'group__slug', 'text',
+            'image', 'card_image', 'card_variants'),
+    ),
+    'comment': (
+        ['post', 'author', 'created', 'text'],
+        lambda: Comment.objects.order_by('id').values_list(
+            'post_id', 'author__username', 'created', 'text'),
+    ),
+    'follow': (
+        ['user', 'author'],
+        lambda: Follow.objects.order_by('id').values_list(
+            'user__username', 'author__username'),
+    ),
+}
+MODELS = list(EXPORTS)
+
+
+def _value(value):
+    if value is None:
+        return ''
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+def export_rows(models=MODELS):
+    """Yield ``(model, record)`` for every exported row, streaming."""
+    for model in models:
+        columns, rows = EXPORTS[model]
+        for row in rows().iterator(chunk_size=BATCH_SIZE):
+            yield model, dict(zip(columns, map(_value, row)))
+
+
+def export(path, data_format, models=MODELS):
+    """Write ``models`` to ``path``; returns {model: rows written}."""
+    written = dict.fromkeys(models, 0)
+    if data_format == 'jsonl':
+        with open(path, 'w', encoding='utf-8') as output:
+            for model, record in export_rows(models):
+                output.write(json.dumps({'model': model, **record},
+                                        ensure_ascii=False) + '\n')
+                written[model] += 1
+        return written
+    os.makedirs(path, exist_ok=True)
+    for model in models:
+        columns = EXPORTS[model][0]
+        with open(os.path.join(path, f'{model}.csv'), 'w', newline='',
+                  encoding='utf-8') as output:
+            writer = csv.DictWriter(output, columns)
+            writer.writeheader()
+            for _, record in export_rows([model]):
+                writer.writerow(record)
+                written[model] += 1
+    return written
+
+
+def read_rows(path, data_format):
+    """Yield ``(model, record)`` from an export, streaming."""
+    if data_format == 'jsonl':
+        with open(path, encoding='utf-8') as source:
+            for line in source:
+                if line.strip():
+                    record = json.loads(line)
+                    yield record.pop('model'), record
+        return
+    for model in MODELS:
+        file_name = os.path.join(path, f'{model}.csv')
+        if not os.path.exists(file_name):
+            continue
+        with open(file_name, newline='', encoding='utf-8') as source:
+            for record in csv.DictReader(source):
+                yield model, record
+
+
+@contextmanager
+def explicit_dates():
+    """Let bulk_create store the given pub_date/created values instead of
+    auto_now_add's "now".
+    """
+    fields = [Post._meta.get_field('pub_date'),
+              Comment._meta.get_field('created')]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+class Importer:
+
+    def __init__(self, batch_size=BATCH_SIZE):
+        self.batch_size = batch_size
+        self.buffers = {model: [] for model in MODELS}
+        # rows inserted, and records left out as duplicates or orphans
+        self.imported = dict.fromkeys(MODELS, 0)
+        self.skipped = dict.fromkeys(MODELS, 0)
+        self.user_ids = {}
+        self.group_ids = {}
+        self.missing_images = 0
+        # comments and follows get increasing ids: the ones from here on
+        # are new, which finish() needs to know without keeping them all
+        self.first_ids = {
+            model: (model.objects.aggregate(last=Max('id'))['last'] or 0) + 1
+            for model in (Comment, Follow)}
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {POST_MAP}')
+            cursor.execute(
+                f'CREATE TEMPORARY TABLE {POST_MAP} ('
+                f'exported_id integer PRIMARY KEY, '
+                f'post_id integer NOT NULL, inserted integer NOT NULL)')
+
+    def add(self, model, record):
+        if model not in self.buffers:
+            raise ValueError(f'Unknown model "{model}"')
+        if any(self.buffers[other] for other in MODELS if other != model):
+            # records of the next model may refer to the previous ones
+            self.flush()
+        self.buffers[model].append(record)
+        if len(self.buffers[model]) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        for model in MODELS:
+            records, self.buffers[model] = self.buffers[model], []
+            if records:
+                with transaction.atomic(), explicit_dates():
+                    inserted = getattr(self, f'import_{model}')(records)
+                self.imported[model] += inserted
+                self.skipped[model] += len(records) - inserted
+
+    def users(self, usernames):
+        missing = set(usernames) - self.user_ids.keys() - {''}
+        if missing:
+            User.objects.bulk_create(
+                [User(username=username, password=make_password(None))
+                 for username in missing], ignore_conflicts=True)
+            self.user_ids.update(User.objects.filter(
+                username__in=missing).values_list('username', 'id'))
+        return self.user_ids
+
+    def import_group(self, records):
+        slugs = {record['slug'] for record in records}
+        existing = set(Group.objects.filter(slug__in=slugs).values_list(
+            'slug', flat=True))
+        groups = {}
+        for record in records:
+            if record['slug'] not in existing:
+                groups.setdefault(record['slug'], Group(
+                    slug=record['slug'], title=record['title'],
+                    description=record['description']))
+        Group.objects.bulk_create(groups.values())
+        self.group_ids.update(Group.objects.filter(
+            slug__in=slugs).values_list('slug', 'id'))
+        return len(groups)
+
+    def group_id(self, slug):
+        if not slug:
+            return None
+        if slug not in self.group_ids:
+            self.group_ids[slug] = Group.objects.filter(
+                slug=slug).values_list('id', flat=True).first()
+        return self.group_ids[slug]
+
+    def mapped_posts(self, exported_ids):
+        """{exported id: post id} for the ids imported so far."""
+        exported_ids = list(exported_ids)
+        if not exported_ids:
+            return {}
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT exported_id, post_id FROM {POST_MAP} '
+                f'WHERE exported_id IN '
+                f'({", ".join(["%s"] * len(exported_ids))})', exported_ids)
+            return dict(cursor.fetchall())
+
+    def import_post(self, records):
+        user_ids = self.users(record['author'] for record in records)
+        exported_ids = [int(record['id']) for record in records]
+        keys = [(user_ids[record['author']],
+                 parse_datetime(record['pub_date']), record['text'])
+                for record in records]
+        existing = {
+            post_id: key for post_id, *key in Post.objects.filter(
+                id__in=exported_ids).values_list(
+                'id', 'author_id', 'pub_date', 'text')}
+        # posts whose id is taken by another post may have been imported
+        # under a new id before
+        moved = [key for post_id, key in zip(exported_ids, keys)
+                 if post_id in existing and existing[post_id] != list(key)]
+        imported_before = {
+            tuple(key): post_id for post_id, *key in Post.objects.filter(
+                author_id__in={key[0] for key in moved},
+                pub_date__in={key[1] for key in moved}).values_list(
+                'id', 'author_id', 'pub_date', 'text')} if moved else {}
+        mapped = self.mapped_posts(set(exported_ids))
+        # (exported id, post id, inserted) rows for POST_MAP
+        new_rows = []
+        next_id = None
+        posts = []
+        for exported_id, key, record in zip(exported_ids, keys, records):
+            if exported_id in mapped:
+                continue
+            post_id = exported_id
+            if post_id in existing:
+                if existing[post_id] == list(key):
+                    mapped[exported_id] = post_id
+                    new_rows.append((exported_id, post_id, 0))
+                    continue
+                if key in imported_before:
+                    mapped[exported_id] = imported_before[key]
+                    new_rows.append((exported_id, imported_before[key], 0))
+                    continue
+                if next_id is None:
+                    next_id = max(
+                        Post.objects.aggregate(last=Max('id'))['last'],
+                        max(exported_ids)) + 1
+                post_id, next_id = next_id, next_id + 1
+            mapped[exported_id] = post_id
+            new_rows.append((exported_id, post_id, 1))
+            author_id, pub_date, text = key
+            image = record.get('image') or ''
+            if image and not default_storage.exists(image):
+                self.missing_images += 1
+            posts.append(Post(
+                id=post_id, text=text, excerpt=make_excerpt(text),
+                pub_date=pub_date, author_id=author_id,
+                group_id=self.group_id(record.get('group')),
+                image=image, card_image=record.get('card_image') or '',
+                card_variants=record.get('card_variants') or ''))
+        Post.objects.bulk_create(posts)
+        with connection.cursor() as cursor:
+            cursor.executemany(f'INSERT INTO {POST_MAP} '
+                               f'VALUES (%s, %s, %s)', new_rows)
+        return len(posts)
+
+    def import_comment(self, records):
+        user_ids = self.users(record['author'] for record in records)
+        post_ids = self.mapped_posts(
+            {int(record['post']) for record in records})
+        comments = []
+        for record in records:
+            post_id = post_ids.get(int(record['post']))
+            if post_id is None:
+                # the post is not part of this import
+                continue
+            comments.append(Comment(
+                post_id=post_id, text=record['text'],
+                author_id=user_ids[record['author']],
+                created=parse_datetime(record['created'])))
+        seen = set(Comment.objects.filter(
+            post_id__in={comment.post_id for comment in comments},
+            created__in={comment.created for comment in comments},
+        ).values_list('post_id', 'author_id', 'created', 'text'))
+        new_comments = []
+        for comment in comments:
+            key = (comment.post_id, comment.author_id, comment.created,
+                   comment.text)
+            if key not in seen:
+                seen.add(key)
+                new_comments.append(comment)
+        Comment.objects.bulk_create(new_comments)
+        return len(new_comments)
+
+    def import_follow(self, records):
+        user_ids = self.users(
+            [record['user'] for record in records]
+            + [record['author'] for record in records])
+        pairs = {(user_ids[record['user']], user_ids[record['author']])
+                 for record in records
+                 if record['user'] != record['author']}
+        pairs -= set(Follow.objects.filter(
+            user_id__in={user_id for user_id, _ in pairs},
+            author_id__in={author_id for _, author_id in pairs},
+        ).values_list('user_id', 'author_id'))
+        Follow.objects.bulk_create(
+            [Follow(user_id=user_id, author_id=author_id)
+             for user_id, author_id in pairs],
+            ignore_conflicts=True)
+        cache.delete_many([FOLLOWED_KEY.format(user_ids[record['user']])
+                           for record in records])
+        return len(pairs)
+
+    def finish(self):
+        """Bring what signals would have kept up to date in line with the
+        imported rows.
+        """
+        self.flush()
+        # posts were inserted with explicit ids (a no-op on SQLite)
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), [Post]):
+                cursor.execute(sql)
+        counters.reconcile_user_stats()
+        counters.reconcile_comment_counts()
+        new_posts = Post.objects.filter(id__in=RawSQL(
+            f'SELECT post_id FROM {POST_MAP} WHERE inserted = 1', []))
+        # followers of the authors of new posts, and the new follows
+        feeds.backfill_timelines(follows=Follow.objects.filter(
+            Q(author_id__in=new_posts.values('author_id'))
+            | Q(id__gte=self.first_ids[Follow])))
+        search.index_posts(Post.objects.filter(
+            Q(id__in=new_posts.values('id'))
+            | Q(id__in=Comment.objects.filter(
+                id__gte=self.first_ids[Comment]).values('post_id'))))
+        unprocessed = new_posts.exclude(image='').filter(
+            card_image='').values_list('id', flat=True)
+        for post_id in unprocessed.iterator():
+            tasks.enqueue('process_post_image', post_id=post_id)
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE {POST_MAP}')
+        bump(SITE_SCOPE)
+        return self.imported
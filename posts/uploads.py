@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+
+
+class BoundedUploadHandler(TemporaryFileUploadHandler):
+    """Stream every upload to a temporary file in chunks, keeping at most
+    POST_IMAGE_MAX_BYTES of it on disk.
+
+    Bytes past the limit are read off the socket and dropped; ``size``
+    still reports the full length, so the form rejects the file with a
+    normal validation error instead of a reset connection.
+    """
+
+    def receive_data_chunk(self, raw_data, start):
+        # keep the head, so the image header can still be read
+        room = settings.POST_IMAGE_MAX_BYTES - start
+        if room > 0:
+            super().receive_data_chunk(raw_data[:room], start)
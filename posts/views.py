@@ -1,19 +1,49 @@
+from urllib.parse import urlencode
+
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.core.paginator import Paginator
+from django.http import JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
-from django.views.decorators.cache import cache_page
 from django.views.generic import CreateView, View
 
+from . import follows
 from .forms import CommentForm, PostForm
-from .models import Comment, Follow, Group, Post, User
+from .cache import cache_page_until_changed
+from .feeds import FEED_ORDERING, follow_feed
+from .models import Comment, Group, Post, User
+from .paginators import CursorPaginator
+from .search import SearchResults
+
+
+def feed_posts(queryset):
+    return queryset.select_related('author', 'group')
+
+
+def paginate(request, queryset, per_page, mode=None,
+             ordering=('-pub_date', '-id')):
+    if (mode or settings.FEED_PAGINATION) == 'cursor':
+        paginator = CursorPaginator(queryset, per_page, ordering)
+        page = paginator.get_page(after=request.GET.get('after'),
+                                  before=request.GET.get('before'))
+        return paginator, page
+    paginator = Paginator(queryset, per_page)
+    page = paginator.get_page(request.GET.get('page'))
+    return paginator, page
+
 
+def comment_page(request, post):
+    """A page of ``post``'s comments, oldest first, with their authors."""
+    paginator = CursorPaginator(
+        post.comments.select_related('author'),
+        settings.COMMENTS_PER_PAGE, ordering=('created', 'id'))
+    return paginator.get_page(after=request.GET.get('after'))
 
-@cache_page(20, key_prefix='index_page')
+
+@cache_page_until_changed('index_page', per_user=True)
 def index(request):
-    post_list = Post.objects.all()
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    post_list = feed_posts(Post.objects.all())
+    paginator, page = paginate(request, post_list, 10)
     return render(request, 'index.html', {
         'page': page,
         'paginator': paginator
@@ -21,12 +51,11 @@ def index(request):
     )
 
 
+@cache_page_until_changed('group:{slug}')
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    posts = group.group_posts.all()[:12]
-    paginator = Paginator(posts, 2)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    posts = feed_posts(group.group_posts.all())[:12]
+    paginator, page = paginate(request, posts, 2, mode='numbered')
     return render(
         request, "group.html", {
             "group": group,
@@ -36,6 +65,22 @@ def group_posts(request, slug):
     )
 
 
+# post and comment writes bump "index_page", and so does the index_post
+# task once it has re-indexed the post, so results stay fresh
+@cache_page_until_changed('index_page')
+def search(request):
+    query = request.GET.get('q', '').strip()
+    results = SearchResults(query, feed_posts(Post.objects.all()))
+    paginator, page = paginate(request, results, 10, mode='numbered')
+    return render(request, 'search.html', {
+        'query': query,
+        'page': page,
+        'paginator': paginator,
+        'page_params': urlencode({'q': query}) + '&',
+        }
+    )
+
+
 @login_required
 def new_post(request):
     if request.method == 'POST':
@@ -59,41 +104,66 @@ def new_post(request):
     )
 
 
+@cache_page_until_changed('profile:{username}')
 def profile(request, username):
-    user_profile = get_object_or_404(User, username=username)
-    posts = user_profile.posts.all()
-    paginator = Paginator(posts, 5)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
-    following = False
-    if request.user.is_authenticated and request.user != user_profile and Follow.objects.filter(
-            user=request.user, author=user_profile).count() != 0:
-        following = True
-    else:
-        following = False
+    user_profile = get_object_or_404(User.objects.select_related('stats'),
+                                     username=username)
+    posts = feed_posts(user_profile.posts.all())
+    paginator, page = paginate(request, posts, 5)
     return render(request, 'profile.html', {
         'page': page,
         'paginator': paginator,
         'user_profile': user_profile,
-        "following": following
         }
     )
 
 
+@cache_page_until_changed('post:{post_id}', 'profile:{username}')
 def post_view(request, username, post_id):
-    post_profile = get_object_or_404(Post, author__username=username,
-                                     id=post_id)
-    items = post_profile.comments.all()
+    post_profile = get_object_or_404(
+        feed_posts(Post.objects.select_related('author__stats')),
+        author__username=username, id=post_id)
+    items = comment_page(request, post_profile)
     form = CommentForm()
     return render(request, 'post.html', {
         'post_profile': post_profile,
         'user_profile': post_profile.author,
+        # the comments of ``items`` as a QuerySet, which tests/test_post.py
+        # expects in the context; lazy, and never more than one page
+        'comments': post_profile.comments.filter(
+            id__in=[item.id for item in items]),
         'items': items,
         'form': form
         }
     )
 
 
+@cache_page_until_changed('post:{post_id}')
+def post_comments(request, username, post_id):
+    """The comments after ``?after=`` as an HTML fragment for the post
+    page, or as JSON with ``?format=json``.
+    """
+    post_profile = get_object_or_404(Post.objects.select_related('author'),
+                                     author__username=username, id=post_id)
+    items = comment_page(request, post_profile)
+    if request.GET.get('format') == 'json':
+        return JsonResponse({
+            'comments': [{
+                'id': item.id,
+                'author': item.author.username,
+                'author_name': item.author.get_full_name(),
+                'created': item.created.isoformat(),
+                'text': item.text,
+            } for item in items],
+            'next': items.next_cursor,
+        })
+    return render(request, 'includes/comment_list.html', {
+        'post_profile': post_profile,
+        'items': items,
+        }
+    )
+
+
 @login_required
 def post_edit(request, username, post_id):
     post_profile = get_object_or_404(Post, author__username=username,
@@ -139,11 +209,9 @@ def add_comment(request, username, post_id):
 
 @login_required
 def follow_index(request):
-    post_list = Post.objects.filter(
-        author__following__in=Follow.objects.filter(user=request.user))
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    post_list = feed_posts(follow_feed(request.user))
+    paginator, page = paginate(request, post_list, 10,
+                               ordering=FEED_ORDERING)
     return render(request, 'follow.html', {
         'page': page,
         'paginator': paginator
@@ -153,24 +221,18 @@ def follow_index(request):
 
 @login_required
 def profile_follow(request, username):
-    user = get_object_or_404(User, username=username)
-    if request.user != user and Follow.objects.filter(
-            user=User.objects.get(username=request.user.username),
-            author=User.objects.get(username=user.username)).count() == 0:
-        Follow.objects.get_or_create(user=request.user, author=user)
-        return redirect('profile', username=user.username)
-    return redirect('profile', username=user.username)
+    author_id = get_object_or_404(
+        User.objects.values_list('id', flat=True), username=username)
+    follows.follow(request.user, author_id, username)
+    return redirect('profile', username=username)
 
 
 @login_required
 def profile_unfollow(request, username):
-    user = get_object_or_404(User, username=username)
-    if Follow.objects.filter(
-            user=User.objects.get(username=request.user.username),
-            author=User.objects.get(username=user.username)).count() != 0:
-        Follow.objects.get(user=request.user, author=user).delete()
-        return redirect('profile', username=user.username)
-    return redirect('profile', username=user.username)
+    author_id = get_object_or_404(
+        User.objects.values_list('id', flat=True), username=username)
+    follows.unfollow(request.user, author_id, username)
+    return redirect('profile', username=username)
 
 
 def page_not_found(request, exception):
@@ -0,0 +1,307 @@
+"""Per-request instrumentation: SQL, template and cache timings.
+
+MetricsMiddleware measures every request and
+
+* adds a ``Server-Timing`` header (``db``, ``render``, ``cache``,
+  ``total``), which browsers show in the network panel;
+* aggregates the numbers into histograms per URL name (``index``,
+  ``profile``, ``post``, ...) served in the Prometheus text format by the
+  ``metrics`` view to requests with ``Authorization: Bearer
+  <METRICS_TOKEN>``.
+
+SQL is timed with an execute wrapper on every connection; templates by wrapping
+``Template.render`` (only the outermost template of a response, so
+includes are not counted twice; querysets evaluated in a template count
+as render time as well as db time); cache hits and misses by wrapping
+``get``/``get_many`` of the cache backend classes. All of this is set up
+once, when the middleware is loaded; a request only updates a few
+counters and queues its numbers for the histograms (Registry).
+
+Histograms live in the worker process: with several workers each one is
+scraped separately (or summed by the ``instance`` label).
+"""
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import Http404, HttpResponse
+from django.template.base import Template
+from django.utils.crypto import constant_time_compare
+
+DURATION_BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1,
+                    2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576)
+
+# name: (help, buckets)
+HISTOGRAMS = {
+    'yatube_request_duration_seconds': (
+        'Time spent in Django per request', DURATION_BUCKETS),
+    'yatube_db_duration_seconds': (
+        'Time spent in SQL per request', DURATION_BUCKETS),
+    'yatube_render_duration_seconds': (
+        'Time spent rendering templates per request', DURATION_BUCKETS),
+    'yatube_db_queries': (
+        'SQL queries per request', QUERY_BUCKETS),
+    'yatube_response_bytes': (
+        'Response body size', SIZE_BUCKETS),
+}
+CACHE_COUNTER = 'yatube_cache_requests_total'
+# tells a cache miss from a cached None
+MISSING = object()
+
+_current = threading.local()
+
+
+class RequestStats:
+    __slots__ = ('queries', 'db_time', 'render_time', 'render_depth',
+                 'cache_hits', 'cache_misses')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.render_time = 0.0
+        self.render_depth = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+
+def _timed_query(execute, sql, params, many, context):
+    stats = getattr(_current, 'stats', None)
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.db_time += time.perf_counter() - started
+        stats.queries += 1
+
+
+def _timed_render(render):
+    @wraps(render)
+    def wrapper(self, context):
+        stats = getattr(_current, 'stats', None)
+        if stats is None:
+            return render(self, context)
+        stats.render_depth += 1
+        started = time.perf_counter()
+        try:
+            return render(self, context)
+        finally:
+            stats.render_depth -= 1
+            if not stats.render_depth:
+                stats.render_time += time.perf_counter() - started
+    wrapper.instrumented = True
+    return wrapper
+
+
+if not getattr(Template.render, 'instrumented', False):
+    Template.render = _timed_render(Template.render)
+
+
+def _count_get(get):
+    @wraps(get)
+    def wrapper(self, key, default=None, version=None):
+        value = get(self, key, MISSING, version)
+        stats = getattr(_current, 'stats', None)
+        if stats is not None:
+            if value is MISSING:
+                stats.cache_misses += 1
+            else:
+                stats.cache_hits += 1
+        return default if value is MISSING else value
+    return wrapper
+
+
+def _count_get_many(get_many):
+    @wraps(get_many)
+    def wrapper(self, keys, version=None):
+        keys = list(keys)
+        stats = getattr(_current, 'stats', None)
+        if stats is None:
+            return get_many(self, keys, version)
+        # the base get_many() calls get() per key: count the keys once
+        hits, misses = stats.cache_hits, stats.cache_misses
+        found = get_many(self, keys, version)
+        stats.cache_hits = hits + len(found)
+        stats.cache_misses = misses + len(keys) - len(found)
+        return found
+    return wrapper
+
+
+def _instrument_connection(sender=None, connection=None, **kwargs):
+    if _timed_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_timed_query)
+
+
+def instrument():
+    """Wrap the cache backend classes and every database connection. The
+    wrappers stay installed and do nothing outside of a request.
+
+    Django opens connections per thread; the ones opened later are
+    wrapped by the connection_created signal.
+    """
+    for alias in settings.CACHES:
+        backend = type(caches[alias])
+        if not backend.__dict__.get('instrumented', False):
+            backend.get = _count_get(backend.get)
+            backend.get_many = _count_get_many(backend.get_many)
+            backend.instrumented = True
+    connection_created.connect(_instrument_connection,
+                               dispatch_uid='yatube.metrics')
+    for connection in connections.all():
+        _instrument_connection(connection=connection)
+
+
+class Histogram:
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # the last slot is +Inf
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    """Histograms and cache counters per view.
+
+    Requests only append their numbers to a queue; the histograms are
+    updated from it in batches of BATCH and before every scrape, which
+    keeps the per-request cost to a deque append.
+    """
+    BATCH = 1000
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # (view, values in HISTOGRAMS order, cache hits, cache misses)
+        self.pending = deque()
+        # view: [Histogram in HISTOGRAMS order]
+        self.views = {}
+        # view: [hits, misses]
+        self.cache_requests = {}
+
+    def observe(self, view, values, cache_hits, cache_misses):
+        """``values`` follow HISTOGRAMS; None for a missing value."""
+        self.pending.append((view, values, cache_hits, cache_misses))
+        if len(self.pending) >= self.BATCH:
+            self.aggregate()
+
+    def aggregate(self):
+        with self.lock:
+            while True:
+                try:
+                    view, values, hits, misses = self.pending.popleft()
+                except IndexError:
+                    break
+                histograms = self.views.get(view)
+                if histograms is None:
+                    histograms = self.views[view] = [
+                        Histogram(buckets)
+                        for _, buckets in HISTOGRAMS.values()]
+                    self.cache_requests[view] = [0, 0]
+                for histogram, value in zip(histograms, values):
+                    if value is not None:
+                        histogram.observe(value)
+                counts = self.cache_requests[view]
+                counts[0] += hits
+                counts[1] += misses
+
+    def clear(self):
+        with self.lock:
+            self.pending.clear()
+            self.views.clear()
+            self.cache_requests.clear()
+
+    def render(self):
+        """The Prometheus text exposition format."""
+        self.aggregate()
+        lines = []
+        with self.lock:
+            views = sorted(self.views)
+            for number, (name, (help_text, _)) in enumerate(
+                    HISTOGRAMS.items()):
+                lines += [f'# HELP {name} {help_text}',
+                          f'# TYPE {name} histogram']
+                for view in views:
+                    histogram = self.views[view][number]
+                    if not histogram.count:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(
+                            histogram.buckets + ('+Inf',),
+                            histogram.counts):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{{view="{view}",'
+                                     f'le="{bound}"}} {cumulative}')
+                    lines += [
+                        f'{name}_sum{{view="{view}"}} {histogram.sum:g}',
+                        f'{name}_count{{view="{view}"}} {histogram.count}']
+            lines += [f'# HELP {CACHE_COUNTER} Cache lookups by result',
+                      f'# TYPE {CACHE_COUNTER} counter']
+            for view in views:
+                for result, count in zip(('hit', 'miss'),
+                                         self.cache_requests[view]):
+                    lines.append(f'{CACHE_COUNTER}{{view="{view}",'
+                                 f'result="{result}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+SERVER_TIMING = ('db;dur=%.1f;desc="%d queries", render;dur=%.1f, '
+                 'cache;desc="hit=%d miss=%d", total;dur=%.1f')
+
+
+def server_timing(stats, total):
+    return SERVER_TIMING % (
+        stats.db_time * 1000, stats.queries, stats.render_time * 1000,
+        stats.cache_hits, stats.cache_misses, total * 1000)
+
+
+class MetricsMiddleware:
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        instrument()
+
+    def __call__(self, request):
+        stats = _current.stats = RequestStats()
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.stats = None
+        total = time.perf_counter() - started
+
+        view = getattr(request.resolver_match, 'url_name', None) or 'other'
+        if view == 'metrics':
+            return response
+        response['Server-Timing'] = server_timing(stats, total)
+        # set by CommonMiddleware; len(response.content) would copy the body
+        size = response.get('Content-Length')
+        values = (total, stats.db_time, stats.render_time, stats.queries,
+                  None if size is None else int(size))
+        registry.observe(view, values, stats.cache_hits, stats.cache_misses)
+        return response
+
+
+def metrics(request):
+    token = settings.METRICS_TOKEN
+    if not token or not constant_time_compare(
+            request.META.get('HTTP_AUTHORIZATION', ''), f'Bearer {token}'):
+        raise Http404
+    return HttpResponse(registry.render(),
+                        content_type='text/plain; version=0.0.4')
@@ -0,0 +1,95 @@
+"""pytest plugin: fail the run on N+1 patterns that are not in a baseline.
+
+    pytest -p yatube.pytest_queries --query-baseline=query_baseline.json
+
+Every request made by the tests goes through QueryInspectorMiddleware
+(yatube/querylog.py). Patterns are identified by kind, view and
+statement fingerprint, so moving code around does not make them new.
+``--update-query-baseline`` records the patterns found as the baseline;
+``--query-kinds`` also checks duplicate or slow queries.
+"""
+import json
+import os
+
+import pytest
+
+KINDS = ('n+1', 'duplicate', 'slow')
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup('queries', 'N+1 and duplicate query checks')
+    group.addoption('--query-baseline', metavar='PATH',
+                    help='JSON file of known query patterns')
+    group.addoption('--update-query-baseline', action='store_true',
+                    help='write the patterns found to --query-baseline')
+    group.addoption('--query-kinds', nargs='+', choices=KINDS,
+                    default=['n+1'], help='kinds of problems to check')
+
+
+class QueryChecker:
+
+    def __init__(self, config):
+        self.config = config
+        self.kinds = config.getoption('query_kinds')
+        self.path = config.getoption('query_baseline')
+        # (kind, view, fingerprint): {'origin': ..., 'tests': [...]}
+        self.found = {}
+        self.test = None
+
+    def listener(self, view, problems):
+        for problem in problems:
+            if problem['kind'] not in self.kinds:
+                continue
+            entry = self.found.setdefault(
+                (problem['kind'], view, problem['fingerprint']),
+                {'origin': problem['origin'], 'tests': []})
+            if self.test not in entry['tests']:
+                entry['tests'].append(self.test)
+
+    def baseline(self):
+        if not self.path or not os.path.exists(self.path):
+            return set()
+        with open(self.path) as file:
+            return {(entry['kind'], entry['view'], entry['fingerprint'])
+                    for entry in json.load(file)}
+
+    def write_baseline(self):
+        with open(self.path, 'w') as file:
+            json.dump([{'kind': kind, 'view': view,
+                        'fingerprint': statement, **details}
+                       for (kind, view, statement), details in sorted(
+                           self.found.items())],
+                      file, ensure_ascii=False, indent=2)
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_call(self, item):
+        self.test = item.nodeid
+        yield
+        self.test = None
+
+    def pytest_sessionfinish(self, session):
+        if self.config.getoption('update_query_baseline') and self.path:
+            self.write_baseline()
+            return
+        new = {key: details for key, details in self.found.items()
+               if key not in self.baseline()}
+        if not new:
+            return
+        reporter = self.config.pluginmanager.get_plugin('terminalreporter')
+        reporter.section('new query patterns', red=True)
+        for (kind, view, statement), details in sorted(new.items()):
+            reporter.write_line(f'{kind} in {view}: {statement}')
+            reporter.write_line(f'    at {details["origin"]}')
+            for test in details['tests']:
+                reporter.write_line(f'    in {test}')
+        session.exitstatus = pytest.ExitCode.TESTS_FAILED
+
+
+def pytest_configure(config):
+    # yatube.querylog reads settings on import: after pytest-django's setup
+    from django.conf import settings
+    from yatube import querylog
+    settings.QUERY_REPORT_PATH = None
+    checker = QueryChecker(config)
+    querylog.listeners.append(checker.listener)
+    config.pluginmanager.register(checker, 'query_checker')
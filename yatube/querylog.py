@@ -0,0 +1,225 @@
+"""Duplicate, N+1 and slow query detection per request.
+
+QueryInspectorMiddleware captures the SQL of a share of the requests (all
+of them with QUERY_INSPECTOR_ALL, QUERY_INSPECTOR_SAMPLE otherwise) and
+checks it for
+
+* ``duplicate``: the same statement with the same parameters run twice;
+* ``n+1``: the same statement with different parameters run at least
+  QUERY_N_PLUS_ONE times from the same place;
+* ``slow``: a statement that took QUERY_SLOW_MS or longer.
+
+Statements are compared by fingerprint: literals and parameters become
+``?`` and ``IN (?, ?, ...)`` lists collapse. Each query is attributed to
+the template line being rendered and to the innermost frame of project
+code that ran it. Problems of the last QUERY_REPORT_WINDOW inspected
+requests are aggregated into the JSON file QUERY_REPORT_PATH.
+
+``yatube/pytest_queries.py`` runs the same checks under pytest.
+"""
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import deque
+
+import django
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from . import metrics
+
+STRING = re.compile(r"'(?:[^']|'')*'")
+NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+PLACEHOLDER_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+WHITESPACE = re.compile(r'\s+')
+# how often the report file may be rewritten, in seconds
+REPORT_INTERVAL = 5
+
+# execute wrappers, never the origin of a query
+INSTRUMENTATION = {__file__, metrics.__file__}
+DJANGO_ROOT = os.path.dirname(django.__file__)
+DJANGO_DB = os.path.join(DJANGO_ROOT, 'db')
+
+_current = threading.local()
+# called with (view, problems) after each inspected request
+listeners = []
+
+
+def fingerprint(sql):
+    sql = sql.replace('%s', '?')
+    sql = STRING.sub('?', sql)
+    sql = NUMBER.sub('?', sql)
+    sql = PLACEHOLDER_LIST.sub('(...)', sql)
+    return WHITESPACE.sub(' ', sql).strip()
+
+
+def _project_file(file_name):
+    return (file_name.startswith(settings.BASE_DIR)
+            and 'site-packages' not in file_name
+            and os.sep + 'tests' not in file_name
+            and file_name not in INSTRUMENTATION)
+
+
+def _short_path(file_name):
+    for root in (settings.BASE_DIR, os.path.dirname(DJANGO_ROOT)):
+        if file_name.startswith(root):
+            return os.path.relpath(file_name, root)
+    return file_name
+
+
+def origin():
+    """``"posts/views.py:40 in profile"`` of the innermost project frame
+    (tests excluded) and ``"template.html:12"`` of the innermost template
+    node being rendered, whichever are found, joined by " < ". Without
+    either, the innermost frame outside of django.db, e.g. a middleware.
+    """
+    template = code = fallback = None
+    frame = sys._getframe(1)
+    while frame is not None and (template is None or code is None):
+        function = frame.f_code
+        file_name = function.co_filename
+        if template is None and function.co_name == 'render_annotated':
+            node = frame.f_locals.get('self')
+            token = getattr(node, 'token', None)
+            if token is not None and node.origin is not None:
+                name = node.origin.template_name or node.origin.name
+                template = f'{name}:{token.lineno}'
+        elif code is None and _project_file(file_name):
+            code = (f'{_short_path(file_name)}:{frame.f_lineno} '
+                    f'in {function.co_name}')
+        if fallback is None and not file_name.startswith(DJANGO_DB) and (
+                file_name not in INSTRUMENTATION):
+            fallback = (f'{_short_path(file_name)}:{frame.f_lineno} '
+                        f'in {function.co_name}')
+        frame = frame.f_back
+    return ' < '.join(filter(None, [code, template])) or fallback
+
+
+def _capture(execute, sql, params, many, context):
+    queries = getattr(_current, 'queries', None)
+    if queries is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        queries.append((sql, repr(params), origin(),
+                        (time.perf_counter() - started) * 1000))
+
+
+def _install(sender=None, connection=None, **kwargs):
+    if _capture not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_capture)
+
+
+def analyze(queries):
+    """Problems found in ``(sql, params, origin, ms)`` tuples."""
+    problems = []
+    # (sql, params): origins; a duplicate may come from two places
+    statements = {}
+    # (fingerprint, origin): distinct params
+    places = {}
+    for sql, params, place, duration in queries:
+        statements.setdefault((sql, params), []).append(place)
+        places.setdefault((fingerprint(sql), place), set()).add(params)
+        if duration >= settings.QUERY_SLOW_MS:
+            problems.append({'kind': 'slow', 'fingerprint': fingerprint(sql),
+                             'origin': place, 'count': 1,
+                             'ms': round(duration, 1)})
+    for (sql, _), where in statements.items():
+        if len(where) > 1:
+            problems.append({'kind': 'duplicate',
+                             'fingerprint': fingerprint(sql),
+                             'origin': ', '.join(dict.fromkeys(where)),
+                             'count': len(where)})
+    for (statement, place), params in places.items():
+        if len(params) >= settings.QUERY_N_PLUS_ONE:
+            problems.append({'kind': 'n+1', 'fingerprint': statement,
+                             'origin': place, 'count': len(params)})
+    return problems
+
+
+class Report:
+    """Problems of the last ``window`` inspected requests."""
+
+    def __init__(self, window):
+        self.lock = threading.Lock()
+        self.requests = deque(maxlen=window)
+        self.written = 0
+
+    def add(self, view, problems):
+        with self.lock:
+            self.requests.append((view, problems))
+
+    def summary(self):
+        with self.lock:
+            requests = list(self.requests)
+        found = {}
+        for view, problems in requests:
+            for problem in problems:
+                key = (problem['kind'], problem['fingerprint'],
+                       problem['origin'])
+                entry = found.setdefault(key, {
+                    'kind': problem['kind'],
+                    'fingerprint': problem['fingerprint'],
+                    'origin': problem['origin'], 'views': set(),
+                    'requests': 0, 'executions': 0})
+                entry['views'].add(view)
+                entry['requests'] += 1
+                entry['executions'] += problem['count']
+                if 'ms' in problem:
+                    entry['max_ms'] = max(entry.get('max_ms', 0),
+                                          problem['ms'])
+        entries = sorted(found.values(), key=lambda entry: (
+            -entry['requests'], entry['kind'], entry['fingerprint']))
+        for entry in entries:
+            entry['views'] = sorted(entry['views'])
+        return {'requests': len(requests), 'problems': entries}
+
+    def write(self, path, force=False):
+        if not force and time.monotonic() - self.written < REPORT_INTERVAL:
+            return
+        self.written = time.monotonic()
+        temporary = f'{path}.{os.getpid()}.tmp'
+        with open(temporary, 'w') as file:
+            json.dump(self.summary(), file, ensure_ascii=False, indent=2)
+        os.replace(temporary, path)
+
+
+report = Report(settings.QUERY_REPORT_WINDOW)
+
+
+class QueryInspectorMiddleware:
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        connection_created.connect(_install, dispatch_uid='yatube.querylog')
+        for connection in connections.all():
+            _install(connection=connection)
+
+    def sampled(self):
+        if listeners or settings.QUERY_INSPECTOR_ALL:
+            return True
+        return random.random() < settings.QUERY_INSPECTOR_SAMPLE
+
+    def __call__(self, request):
+        if not self.sampled():
+            return self.get_response(request)
+        queries = _current.queries = []
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.queries = None
+        view = getattr(request.resolver_match, 'url_name', None) or 'other'
+        problems = analyze(queries)
+        for listener in listeners:
+            listener(view, problems)
+        report.add(view, problems)
+        if problems and settings.QUERY_REPORT_PATH:
+            report.write(settings.QUERY_REPORT_PATH)
+        return response
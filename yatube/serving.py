@@ -0,0 +1,173 @@
+"""WSGI middleware serving STATIC_URL and MEDIA_URL straight from disk.
+
+Requests for files are answered before Django is entered:
+
+* names that carry a content hash (ManifestStaticFilesStorage's
+  ``app.1a2b3c4d5e6f.css``, posts.storage's ``ab/ab12….jpg``) are sent with
+  a one-year ``immutable`` Cache-Control, everything else must revalidate;
+* ETag / If-None-Match and Last-Modified / If-Modified-Since give 304s;
+* a single ``Range`` is answered with 206 (or 416);
+* ``.br`` / ``.gz`` files written next to the original by collectstatic
+  (yatube/staticfiles.py) are sent to clients that accept them;
+* full responses go through ``wsgi.file_wrapper``, which gunicorn turns
+  into sendfile(2).
+
+Anything that is not an existing file falls through to Django.
+"""
+import mimetypes
+import os
+import re
+from email.utils import formatdate, parsedate_to_datetime
+
+from django.conf import settings
+
+IMMUTABLE_NAME = re.compile(r'(\.[0-9a-f]{12}|/[0-9a-f]{32})\.\w+$')
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache'
+# preferred first
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+BLOCK_SIZE = 64 * 1024
+
+
+def accepts(environ, encoding):
+    accepted = environ.get('HTTP_ACCEPT_ENCODING', '')
+    return any(part.split(';')[0].strip() == encoding
+               for part in accepted.split(','))
+
+
+def parse_range(header, size):
+    """``(start, end)`` inclusive for a single satisfiable range, None for
+    a header we do not handle (the whole file is sent), or False if the
+    range cannot be satisfied.
+    """
+    match = RANGE.match(header.replace(' ', ''))
+    if not match or match.groups() == ('', ''):
+        return None
+    start, end = match.groups()
+    if not start:
+        # "bytes=-N": the last N bytes
+        start, end = max(0, size - int(end)), size - 1
+    else:
+        start = int(start)
+        end = min(int(end), size - 1) if end else size - 1
+    if start > end or start >= size:
+        return False
+    return start, end
+
+
+def close(file):
+    if file is not None:
+        file.close()
+    return []
+
+
+def read_range(file, start, length):
+    try:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(BLOCK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        file.close()
+
+
+class StaticFilesMiddleware:
+
+    def __init__(self, application):
+        self.application = application
+
+    def roots(self):
+        return [(settings.STATIC_URL, settings.STATIC_ROOT),
+                (settings.MEDIA_URL, settings.MEDIA_ROOT)]
+
+    def find(self, path):
+        for prefix, root in self.roots():
+            if not prefix or not root or not path.startswith(prefix):
+                continue
+            root = os.path.realpath(root)
+            full_path = os.path.realpath(
+                os.path.join(root, path[len(prefix):]))
+            if full_path.startswith(root + os.sep) and os.path.isfile(
+                    full_path):
+                return full_path
+        return None
+
+    def __call__(self, environ, start_response):
+        if environ['REQUEST_METHOD'] not in ('GET', 'HEAD'):
+            return self.application(environ, start_response)
+        path = self.find(environ.get('PATH_INFO', ''))
+        if path is None:
+            return self.application(environ, start_response)
+        return self.serve(environ, start_response, path)
+
+    def serve(self, environ, start_response, path):
+        range_header = environ.get('HTTP_RANGE')
+        headers = [
+            ('Cache-Control', IMMUTABLE if IMMUTABLE_NAME.search(path)
+             else REVALIDATE),
+            ('Content-Type',
+             mimetypes.guess_type(path)[0] or 'application/octet-stream'),
+            ('Accept-Ranges', 'bytes'),
+            ('Vary', 'Accept-Encoding'),
+        ]
+        modified = os.stat(path).st_mtime
+        if not range_header:
+            for encoding, suffix in ENCODINGS:
+                if accepts(environ, encoding) and os.path.isfile(
+                        path + suffix):
+                    path += suffix
+                    headers.append(('Content-Encoding', encoding))
+                    break
+        stat = os.stat(path)
+        # each encoding is a different representation with its own tag
+        etag = f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+        headers += [('ETag', etag),
+                    ('Last-Modified', formatdate(modified, usegmt=True))]
+        if self.not_modified(environ, etag, modified):
+            start_response('304 Not Modified', headers)
+            return []
+
+        body = None
+        if environ['REQUEST_METHOD'] == 'GET':
+            body = open(path, 'rb')
+        if range_header and environ.get('HTTP_IF_RANGE', etag) == etag:
+            byte_range = parse_range(range_header, stat.st_size)
+            if byte_range is False:
+                start_response('416 Range Not Satisfiable', headers + [
+                    ('Content-Range', f'bytes */{stat.st_size}'),
+                    ('Content-Length', '0')])
+                return close(body)
+            if byte_range:
+                start, end = byte_range
+                length = end - start + 1
+                start_response('206 Partial Content', headers + [
+                    ('Content-Range', f'bytes {start}-{end}/{stat.st_size}'),
+                    ('Content-Length', str(length))])
+                return read_range(body, start, length) if body else []
+
+        start_response('200 OK',
+                       headers + [('Content-Length', str(stat.st_size))])
+        if body is None:
+            return []
+        file_wrapper = environ.get('wsgi.file_wrapper')
+        if file_wrapper is not None:
+            return file_wrapper(body, BLOCK_SIZE)
+        return read_range(body, 0, stat.st_size)
+
+    def not_modified(self, environ, etag, modified):
+        if_none_match = environ.get('HTTP_IF_NONE_MATCH')
+        if if_none_match is not None:
+            tags = [tag.strip() for tag in if_none_match.split(',')]
+            return '*' in tags or etag in tags or f'W/{etag}' in tags
+        if_modified_since = environ.get('HTTP_IF_MODIFIED_SINCE')
+        if if_modified_since:
+            try:
+                since = parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+            return int(modified) <= since
+        return False
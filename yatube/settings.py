@@ -1,4 +1,5 @@
 import os
+import tempfile
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
@@ -29,6 +30,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # first, so that it times the other middleware too (yatube/metrics.py)
+    'yatube.metrics.MetricsMiddleware',
+    'yatube.querylog.QueryInspectorMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -56,6 +60,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'posts.context_processors.followed_authors',
             ],
         },
     },
@@ -85,12 +90,32 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
-CACHES = {
-    'default': {
+# "locmem" is private to each process; "sqlite" is a file shared by all
+# worker processes on the host (see yatube/sqlite_cache.py).
+CACHE_BACKEND = os.environ.get("YATUBE_CACHE", "locmem")
+
+CACHE_BACKENDS = {
+    'locmem': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+    },
+    'sqlite': {
+        'BACKEND': 'yatube.sqlite_cache.SQLiteCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache', 'cache.sqlite3'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 50000,
+            'MAX_SIZE': 256 * 1024 * 1024,
+        },
+    },
+}
+
+CACHES = {
+    'default': CACHE_BACKENDS[CACHE_BACKEND],
 }
 
+# Cached pages are invalidated by writes (see posts.cache), so they can live
+# for a long time.
+PAGE_CACHE_TIMEOUT = 60 * 60 * 24
+
 LANGUAGE_CODE = 'ru'
 
 TIME_ZONE = 'UTC'
@@ -103,9 +128,14 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 STATIC_ROOT = os.path.join(BASE_DIR, "static")
+# collectstatic writes hashed names and .gz/.br copies; STATIC_URL and
+# MEDIA_URL are served by yatube/serving.py (see yatube/wsgi.py).
+STATICFILES_STORAGE = "yatube.staticfiles.CompressedManifestStaticFilesStorage"
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# Uploads are named by content hash and deduplicated (posts/storage.py).
+DEFAULT_FILE_STORAGE = 'posts.storage.HashedFileSystemStorage'
 
 # Login
 
@@ -119,3 +149,54 @@ EMAIL_BACKEND = "django.core.mail.backends.filebased.EmailBackend"
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, "sent_emails")
 
 SITE_ID = 1
+
+# Feed pagination: "numbered" (Paginator, ?page=N) or "cursor"
+# (keyset on pub_date/id, ?after=/?before=, no COUNT or OFFSET).
+# Group pages always use numbered pages.
+FEED_PAGINATION = "numbered"
+
+# Comments under a post: the first page is rendered with the post, the rest
+# is fetched by cursor (?after=) from the post_comments view.
+COMMENTS_PER_PAGE = 20
+
+# Follow feed fan-out: new posts are copied into followers' timelines unless
+# the author has more followers than this; such authors are merged on read.
+FEED_FANOUT_MAX_FOLLOWERS = 1000
+# How many of an author's latest posts are copied on a new follow.
+FEED_BACKFILL_POSTS = 500
+
+# Background tasks (posts.tasks), run by "python manage.py run_tasks".
+TASKS_POLL_INTERVAL = 1
+TASKS_MAX_ATTEMPTS = 3
+TASKS_STALE_AFTER = 600
+
+# Uploads are streamed to a temporary file (posts/uploads.py); the request
+# only reads the image header, the pixels are decoded by posts.tasks.
+FILE_UPLOAD_HANDLERS = ["posts.uploads.BoundedUploadHandler"]
+POST_IMAGE_MAX_BYTES = 20 * 1024 * 1024
+POST_IMAGE_MAX_PIXELS = 60 * 1000 * 1000
+# Originals with a longer side are downsized when processed.
+POST_IMAGE_MAX_SIDE = 2560
+
+# Post search (posts/search.py): "fts5" (SQLite FTS5 table), "postings"
+# (inverted index in a regular table) or "auto" (FTS5 when available).
+SEARCH_BACKEND = "auto"
+
+# Request metrics (yatube/metrics.py) are served at /metrics to scrapers
+# sending "Authorization: Bearer <token>"; without a token /metrics is off.
+METRICS_TOKEN = os.environ.get("YATUBE_METRICS_TOKEN", "")
+
+# SQL inspection (yatube/querylog.py): the share of requests checked for
+# duplicate, N+1 and slow queries. YATUBE_QUERY_INSPECT=1 checks every
+# request, e.g. while profiling locally; it is off with DEBUG as well,
+# since it walks the stack on every query.
+QUERY_INSPECTOR_ALL = os.environ.get("YATUBE_QUERY_INSPECT") == "1"
+QUERY_INSPECTOR_SAMPLE = float(os.environ.get("YATUBE_QUERY_SAMPLE", 0))
+QUERY_SLOW_MS = 100
+# the same statement from one place with this many different parameters
+QUERY_N_PLUS_ONE = 3
+# outside of the source tree unless YATUBE_QUERY_REPORT says otherwise
+QUERY_REPORT_PATH = os.environ.get(
+    "YATUBE_QUERY_REPORT",
+    os.path.join(tempfile.gettempdir(), "yatube_query_report.json"))
+QUERY_REPORT_WINDOW = 1000
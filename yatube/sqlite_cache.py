@@ -0,0 +1,224 @@
+"""Cache backend stored in a local SQLite file.
+
+Unlike LocMemCache it is shared by every worker process on the host, so an
+invalidation done by one gunicorn worker is seen by all of them, and unlike
+memcached/redis it needs no extra service. The file runs in WAL mode, so
+readers never block each other or the writer.
+
+Entries are evicted least-recently-used first once there are more than
+MAX_ENTRIES of them or their pickled size exceeds MAX_SIZE bytes.
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    expires REAL,
+    accessed REAL NOT NULL,
+    size INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed);
+"""
+
+# A hit refreshes the LRU timestamp only if it is older than this, so hot
+# keys are read without turning every get() into a write.
+ACCESS_RESOLUTION = 1.0
+# Limits are checked every CULL_EVERY writes per process.
+CULL_EVERY = 50
+
+
+class SQLiteCache(BaseCache):
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._path = location
+        self._max_size = int(options.get('MAX_SIZE', 64 * 1024 * 1024))
+        self._local = threading.local()
+        self._writes = 0
+
+    @property
+    def _db(self):
+        connection = getattr(self._local, 'connection', None)
+        # a connection must not cross a fork (e.g. gunicorn --preload)
+        if connection is None or self._local.pid != os.getpid():
+            directory = os.path.dirname(self._path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self._path, timeout=30,
+                                         isolation_level=None,
+                                         check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.executescript(SCHEMA)
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    @contextmanager
+    def _immediate(self):
+        """A write transaction: committed if the block succeeds, rolled
+        back (and the error re-raised) otherwise.
+        """
+        db = self._db
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            yield db
+        except BaseException:
+            # SQLite may have rolled back already, e.g. on SQLITE_FULL
+            if db.in_transaction:
+                db.execute('ROLLBACK')
+            raise
+        db.execute('COMMIT')
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def _write(self, sql, params):
+        cursor = self._db.execute(sql, params)
+        self._writes += 1
+        if self._writes % CULL_EVERY == 0:
+            self._cull()
+        return cursor
+
+    def _cull(self):
+        db = self._db
+        count, size = db.execute(
+            'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache').fetchone()
+        now = time.time()
+        if count > self._max_entries or size > self._max_size:
+            db.execute('DELETE FROM cache WHERE expires < ?', (now,))
+            count, size = db.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache'
+            ).fetchone()
+        if count > self._max_entries or size > self._max_size:
+            # keep the most recently used rows that fit in both limits
+            db.execute(
+                'DELETE FROM cache WHERE key IN ('
+                ' SELECT key FROM ('
+                '  SELECT key,'
+                '   ROW_NUMBER() OVER recent AS position,'
+                '   SUM(size) OVER recent AS total'
+                '  FROM cache'
+                '  WINDOW recent AS (ORDER BY accessed DESC'
+                '   ROWS UNBOUNDED PRECEDING))'
+                ' WHERE position > ? OR total > ?)',
+                (self._max_entries, self._max_size))
+
+    def _store(self, key, value, timeout, verb):
+        data = pickle.dumps(value, self.pickle_protocol)
+        return self._write(
+            f'{verb} INTO cache (key, value, expires, accessed, size) '
+            'VALUES (?, ?, ?, ?, ?)',
+            (key, data, self.get_backend_timeout(timeout), time.time(),
+             len(data)))
+
+    def _fetch(self, keys):
+        now = time.time()
+        found = {}
+        stale = []
+        touched = []
+        for chunk_start in range(0, len(keys), 500):
+            chunk = keys[chunk_start:chunk_start + 500]
+            rows = self._db.execute(
+                'SELECT key, value, expires, accessed FROM cache '
+                'WHERE key IN (%s)' % ','.join('?' * len(chunk)), chunk)
+            for key, value, expires, accessed in rows:
+                if expires is not None and expires <= now:
+                    stale.append(key)
+                    continue
+                found[key] = pickle.loads(value)
+                if accessed < now - ACCESS_RESOLUTION:
+                    touched.append(key)
+        if stale:
+            self._db.executemany('DELETE FROM cache WHERE key = ?',
+                                 [(key,) for key in stale])
+        if touched:
+            self._db.executemany('UPDATE cache SET accessed = ? WHERE key = ?',
+                                 [(now, key) for key in touched])
+        return found
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        with self._immediate() as db:
+            db.execute('DELETE FROM cache WHERE key = ? AND expires <= ?',
+                       (key, time.time()))
+            added = self._store(key, value, timeout,
+                                'INSERT OR IGNORE').rowcount == 1
+        return added
+
+    def get(self, key, default=None, version=None):
+        key = self._key(key, version)
+        return self._fetch([key]).get(key, default)
+
+    def get_many(self, keys, version=None):
+        made = {self._key(key, version): key for key in keys}
+        found = self._fetch(list(made))
+        return {made[key]: value for key, value in found.items()}
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._store(self._key(key, version), value, timeout,
+                    'INSERT OR REPLACE')
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        with self._immediate():
+            for key, value in data.items():
+                self._store(self._key(key, version), value, timeout,
+                            'INSERT OR REPLACE')
+        return []
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        cursor = self._write(
+            'UPDATE cache SET expires = ? WHERE key = ? '
+            'AND (expires IS NULL OR expires > ?)',
+            (self.get_backend_timeout(timeout), self._key(key, version),
+             time.time()))
+        return cursor.rowcount == 1
+
+    def incr(self, key, delta=1, version=None):
+        key = self._key(key, version)
+        with self._immediate() as db:
+            row = db.execute(
+                'SELECT value, expires FROM cache WHERE key = ?',
+                (key,)).fetchone()
+            if row is None or (row[1] is not None and row[1] <= time.time()):
+                raise ValueError("Key '%s' not found" % key)
+            value = pickle.loads(row[0]) + delta
+            data = pickle.dumps(value, self.pickle_protocol)
+            db.execute('UPDATE cache SET value = ?, size = ? WHERE key = ?',
+                       (data, len(data), key))
+        return value
+
+    def has_key(self, key, version=None):
+        key = self._key(key, version)
+        row = self._db.execute(
+            'SELECT 1 FROM cache WHERE key = ? '
+            'AND (expires IS NULL OR expires > ?)',
+            (key, time.time())).fetchone()
+        return row is not None
+
+    def delete(self, key, version=None):
+        self._db.execute('DELETE FROM cache WHERE key = ?',
+                         (self._key(key, version),))
+
+    def delete_many(self, keys, version=None):
+        self._db.executemany('DELETE FROM cache WHERE key = ?',
+                             [(self._key(key, version),) for key in keys])
+
+    def clear(self):
+        self._db.execute('DELETE FROM cache')
+
+    def close(self, **kwargs):
+        # connections are per thread and reused across requests
+        pass
@@ -0,0 +1,67 @@
+"""collectstatic storage: hashed names plus precompressed copies.
+
+Each collected text asset (bootstrap, jquery, ...) gets ``.gz`` and, when
+the optional ``brotli`` package is installed, ``.br`` siblings, served by
+yatube/serving.py to clients that accept them.
+"""
+import gzip
+import io
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE = ('.css', '.js', '.map', '.svg', '.txt', '.html', '.json',
+                '.xml', '.ico', '.ttf', '.eot', '.otf')
+
+
+def gzip_compress(data):
+    buffer = io.BytesIO()
+    # mtime=0 keeps the output reproducible between deploys
+    with gzip.GzipFile(fileobj=buffer, mode='wb', compresslevel=9,
+                       mtime=0) as archive:
+        archive.write(data)
+    return buffer.getvalue()
+
+
+def compressors():
+    yield '.gz', gzip_compress
+    if brotli is not None:
+        yield '.br', lambda data: brotli.compress(
+            data, quality=11, mode=brotli.MODE_TEXT)
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    # templates still render when a file was not collected (tests, a fresh
+    # checkout): the unhashed URL is used instead of raising
+    manifest_strict = False
+
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            return name
+
+    def post_process(self, paths, dry_run=False, **options):
+        for name, hashed_name, processed in super().post_process(
+                paths, dry_run, **options):
+            if not dry_run and hashed_name and not isinstance(
+                    processed, Exception):
+                self.compress(hashed_name)
+            yield name, hashed_name, processed
+
+    def compress(self, name):
+        if not name.endswith(COMPRESSIBLE):
+            return
+        with self.open(name) as source:
+            data = source.read()
+        for suffix, compress in compressors():
+            compressed = compress(data)
+            # not worth it for tiny or already compressed files
+            if len(compressed) < len(data) * 0.95:
+                self.delete(name + suffix)
+                self._save(name + suffix, ContentFile(compressed))
@@ -0,0 +1,351 @@
+import gzip
+import io
+import json
+import os
+import re
+import tempfile
+import threading
+from unittest import mock
+from wsgiref.util import setup_testing_defaults
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.management import call_command
+from django.core.cache import cache
+from django.db import connection
+from django.http import HttpResponse
+from django.template import engines
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import path, reverse
+
+from posts.models import Post, User
+
+from . import metrics, querylog
+from .metrics import registry
+from .serving import StaticFilesMiddleware
+from .sqlite_cache import SQLiteCache
+
+
+class SQLiteCacheTest(SimpleTestCase):
+
+    def make_cache(self, **options):
+        params = {'OPTIONS': options}
+        return SQLiteCache(os.path.join(self.directory.name, 'cache.db'),
+                           params)
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = self.make_cache()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_basic_operations(self):
+        self.cache.set('page', {'html': 'страница'})
+        self.assertEqual(self.cache.get('page'), {'html': 'страница'})
+        self.assertFalse(self.cache.add('page', 'другая'))
+        self.assertTrue(self.cache.add('counter', 1, None))
+        self.assertEqual(self.cache.incr('counter'), 2)
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+        self.cache.set_many({'a': 1, 'b': 2})
+        self.assertEqual(self.cache.get_many(['a', 'b', 'c']),
+                         {'a': 1, 'b': 2})
+        self.cache.delete('a')
+        self.assertFalse(self.cache.has_key('a'))
+        self.cache.set('gone', 1, 0)
+        self.assertIsNone(self.cache.get('gone'))
+        self.cache.clear()
+        self.assertIsNone(self.cache.get('b'))
+
+    def test_failed_write_is_rolled_back(self):
+        with self.assertRaises(TypeError):
+            # the lock cannot be pickled
+            self.cache.set_many({'a': 1, 'b': threading.Lock()})
+        self.assertIsNone(self.cache.get('a'))
+        self.cache.set_many({'a': 1})
+        self.assertEqual(self.cache.get('a'), 1)
+
+    def test_shared_between_instances(self):
+        other = self.make_cache()
+        self.cache.set('key', 'value', DEFAULT_TIMEOUT)
+        self.assertEqual(other.get('key'), 'value')
+        other.delete('key')
+        self.assertIsNone(self.cache.get('key'))
+
+    def test_lru_eviction(self):
+        cache = self.make_cache(MAX_ENTRIES=10)
+        for number in range(20):
+            cache.set(f'key{number}', number)
+        # key0 is used again, so it is no longer the least recently used
+        cache._db.execute('UPDATE cache SET accessed = accessed - 10')
+        cache.get('key0')
+        cache._cull()
+        count = cache._db.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        self.assertLessEqual(count, 10)
+        self.assertEqual(cache.get('key0'), 0)
+        self.assertIsNone(cache.get('key1'))
+
+    def test_size_limit(self):
+        cache = self.make_cache(MAX_SIZE=10 * 1024)
+        for number in range(30):
+            cache.set(f'key{number}', b'x' * 1024)
+        cache._cull()
+        size = cache._db.execute('SELECT SUM(size) FROM cache').fetchone()[0]
+        self.assertLessEqual(size, 10 * 1024)
+
+    def test_threads_share_file(self):
+        def worker(number):
+            self.cache.set(f'thread{number}', number)
+        threads = [threading.Thread(target=worker, args=(number,))
+                   for number in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(self.cache.get_many(
+            [f'thread{number}' for number in range(4)])), 4)
+
+
+class StaticServingTest(SimpleTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(
+            STATIC_ROOT=self.directory.name, STATIC_URL='/static/')
+        self.settings_override.enable()
+        self.write('app.0123456789ab.css', b'body { color: red; }')
+        self.write('robots.txt', b'User-agent: *')
+
+        def django(environ, start_response):
+            start_response('404 Not Found', [])
+            return [b'django']
+        self.app = StaticFilesMiddleware(django)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.directory.cleanup()
+
+    def write(self, name, content):
+        with open(os.path.join(self.directory.name, name), 'wb') as file:
+            file.write(content)
+
+    def get(self, path, method='GET', **headers):
+        environ = {'PATH_INFO': path, 'REQUEST_METHOD': method}
+        environ.update(headers)
+        setup_testing_defaults(environ)
+        response = {}
+
+        def start_response(status, headers):
+            response['status'] = status
+            response['headers'] = dict(headers)
+        body = b''.join(self.app(environ, start_response))
+        return response['status'], response['headers'], body
+
+    def test_hashed_file_is_immutable(self):
+        status, headers, body = self.get('/static/app.0123456789ab.css')
+        self.assertEqual(status, '200 OK')
+        self.assertEqual(body, b'body { color: red; }')
+        self.assertEqual(headers['Content-Type'], 'text/css')
+        self.assertIn('immutable', headers['Cache-Control'])
+        self.assertEqual(headers['Content-Length'], str(len(body)))
+        _, headers, _ = self.get('/static/robots.txt')
+        self.assertEqual(headers['Cache-Control'], 'no-cache')
+
+    def test_conditional_request(self):
+        _, headers, _ = self.get('/static/robots.txt')
+        status, _, body = self.get('/static/robots.txt',
+                                   HTTP_IF_NONE_MATCH=headers['ETag'])
+        self.assertEqual((status, body), ('304 Not Modified', b''))
+        status, _, _ = self.get('/static/robots.txt',
+                                HTTP_IF_NONE_MATCH='"other"')
+        self.assertEqual(status, '200 OK')
+
+    def test_range(self):
+        status, headers, body = self.get('/static/robots.txt',
+                                         HTTP_RANGE='bytes=0-3')
+        self.assertEqual((status, body), ('206 Partial Content', b'User'))
+        self.assertEqual(headers['Content-Range'], 'bytes 0-3/13')
+        _, _, body = self.get('/static/robots.txt', HTTP_RANGE='bytes=-1')
+        self.assertEqual(body, b'*')
+        status, headers, _ = self.get('/static/robots.txt',
+                                      HTTP_RANGE='bytes=20-')
+        self.assertEqual(status, '416 Range Not Satisfiable')
+        self.assertEqual(headers['Content-Range'], 'bytes */13')
+
+    def test_precompressed_variant(self):
+        self.write('app.0123456789ab.css.gz',
+                   gzip.compress(b'body { color: red; }'))
+        status, headers, body = self.get(
+            '/static/app.0123456789ab.css',
+            HTTP_ACCEPT_ENCODING='br;q=1.0, gzip;q=0.8')
+        self.assertEqual(headers['Content-Encoding'], 'gzip')
+        self.assertEqual(headers['Content-Type'], 'text/css')
+        self.assertEqual(gzip.decompress(body), b'body { color: red; }')
+        _, headers, _ = self.get('/static/app.0123456789ab.css')
+        self.assertNotIn('Content-Encoding', headers)
+
+    def test_other_requests_reach_django(self):
+        for url, method in [('/static/missing.css', 'GET'),
+                            ('/static/../etc/passwd', 'GET'),
+                            ('/static/robots.txt', 'POST'),
+                            ('/about/', 'GET')]:
+            with self.subTest(url=url, method=method):
+                self.assertEqual(self.get(url, method)[2], b'django')
+
+    def test_collectstatic_writes_compressed_copies(self):
+        source = tempfile.TemporaryDirectory()
+        self.addCleanup(source.cleanup)
+        css = b'body { margin: 0; }' * 100
+        with open(os.path.join(source.name, 'site.css'), 'wb') as file:
+            file.write(css)
+        with override_settings(STATICFILES_DIRS=[source.name]):
+            call_command('collectstatic', interactive=False,
+                         stdout=io.StringIO())
+        names = os.listdir(self.directory.name)
+        hashed = [name for name in names
+                  if name.startswith('site.') and name.endswith('.css')
+                  and name != 'site.css']
+        self.assertEqual(len(hashed), 1)
+        with open(os.path.join(self.directory.name,
+                               hashed[0] + '.gz'), 'rb') as file:
+            self.assertEqual(gzip.decompress(file.read()), css)
+
+
+@override_settings(METRICS_TOKEN='secret')
+class MetricsTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        registry.clear()
+
+    def test_server_timing(self):
+        response = self.client.get(reverse('index'))
+        timing = dict(part.strip().split(';', 1) for part in
+                      response['Server-Timing'].split(','))
+        self.assertRegex(timing['db'], r'^dur=[\d.]+;desc="[1-9]\d* queries"$')
+        self.assertRegex(timing['render'], r'^dur=[\d.]+$')
+        self.assertRegex(timing['cache'], r'^desc="hit=\d+ miss=[1-9]\d*"$')
+
+    def test_histograms_per_view(self):
+        for _ in range(2):
+            self.client.get(reverse('index'))
+        self.client.get(reverse('group_posts', args=['missing']))
+        text = self.client.get(reverse('metrics'),
+                               HTTP_AUTHORIZATION='Bearer secret',
+                               ).content.decode()
+        self.assertIn('# TYPE yatube_db_queries histogram', text)
+        self.assertIn('yatube_request_duration_seconds_count{view="index"} 2',
+                      text)
+        self.assertIn('yatube_db_queries_count{view="group_posts"} 1', text)
+        self.assertIn('yatube_response_bytes_bucket{view="index",le="+Inf"} 2',
+                      text)
+        # the second request to index is served from the page cache
+        hits = re.search(r'yatube_cache_requests_total\{view="index",'
+                         r'result="hit"\} (\d+)', text)
+        self.assertGreater(int(hits.group(1)), 0)
+        self.assertNotIn('view="metrics"', text)
+
+    def test_connections_of_other_threads_are_timed(self):
+        self.client.get(reverse('index'))
+        wrappers = []
+
+        def query():
+            connection.ensure_connection()
+            wrappers.extend(connection.execute_wrappers)
+            connection.close()
+
+        thread = threading.Thread(target=query)
+        thread.start()
+        thread.join()
+        self.assertIn(metrics._timed_query, wrappers)
+
+    def test_metrics_need_token(self):
+        self.assertEqual(self.client.get(
+            reverse('metrics'), HTTP_AUTHORIZATION='Bearer wrong',
+        ).status_code, 404)
+        with override_settings(METRICS_TOKEN=''):
+            self.assertEqual(self.client.get(
+                reverse('metrics'), HTTP_AUTHORIZATION='Bearer ',
+            ).status_code, 404)
+
+
+def authors_view(request):
+    template = engines['django'].from_string(
+        'Авторы:\n{% for post in posts %}{{ post.author.username }}'
+        '{% endfor %}')
+    User.objects.get(username='first')
+    User.objects.get(username='first')
+    return HttpResponse(template.render({'posts': Post.objects.all()}))
+
+
+urlpatterns = [path('authors/', authors_view, name='authors')]
+
+
+@override_settings(ROOT_URLCONF='yatube.tests')
+class QueryInspectorTest(TestCase):
+
+    def setUp(self):
+        for name in ('first', 'second', 'third'):
+            Post.objects.create(
+                text='Пост', author=User.objects.create(username=name))
+        self.problems = []
+        querylog.listeners.append(self.listener)
+        self.addCleanup(querylog.listeners.remove, self.listener)
+
+    def listener(self, view, problems):
+        self.problems += [(view, problem) for problem in problems]
+
+    def find(self, kind):
+        return [problem for view, problem in self.problems
+                if problem['kind'] == kind and view == 'authors']
+
+    def test_fingerprint(self):
+        self.assertEqual(
+            querylog.fingerprint(
+                "SELECT * FROM t WHERE id IN (%s, %s, %s)\n AND "
+                "name = 'it''s' LIMIT 21"),
+            'SELECT * FROM t WHERE id IN (...) AND name = ? LIMIT ?')
+
+    def test_duplicates_and_n_plus_one(self):
+        self.client.get(reverse('authors'))
+        duplicate, = self.find('duplicate')
+        self.assertIn('"auth_user"."username" = ?', duplicate['fingerprint'])
+        self.assertEqual(duplicate['count'], 2)
+        n_plus_one, = self.find('n+1')
+        self.assertIn('"auth_user"."id" = ?', n_plus_one['fingerprint'])
+        self.assertEqual(n_plus_one['count'], 3)
+        # the template line that ran the queries
+        self.assertTrue(n_plus_one['origin'].endswith(':2'))
+        self.assertFalse(self.find('slow'))
+
+    @override_settings(QUERY_SLOW_MS=0)
+    def test_rolling_report(self):
+        report = querylog.Report(window=2)
+        for _ in range(3):
+            self.problems = []
+            self.client.get(reverse('authors'))
+            report.add('authors', self.find('n+1'))
+        self.assertTrue(self.find('slow'))
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'report.json')
+            report.write(path, force=True)
+            with open(path) as file:
+                summary = json.load(file)
+        self.assertEqual(summary['requests'], 2)
+        problem, = summary['problems']
+        self.assertEqual((problem['kind'], problem['views'],
+                          problem['requests'], problem['executions']),
+                         ('n+1', ['authors'], 2, 6))
+
+    @override_settings(DEBUG=True, QUERY_INSPECTOR_SAMPLE=0)
+    def test_inspection_is_opt_in(self):
+        querylog.listeners.remove(self.listener)
+        self.addCleanup(querylog.listeners.append, self.listener)
+        inspected = []
+        with mock.patch.object(querylog.report, 'add',
+                               lambda view, problems: inspected.append(view)):
+            self.client.get(reverse('authors'))
+            self.assertEqual(inspected, [])
+            with override_settings(QUERY_INSPECTOR_ALL=True):
+                self.client.get(reverse('authors'))
+        self.assertEqual(inspected, ['authors'])
@@ -1,14 +1,15 @@
-from django.conf import settings
 from django.conf.urls import handler404, handler500
-from django.conf.urls.static import static
 from django.contrib import admin
 from django.contrib.flatpages import views
 from django.urls import include, path
 
+from yatube.metrics import metrics
+
 urlpatterns = [
     path("auth/", include("users.urls")),
     path("auth/", include("django.contrib.auth.urls")),
     path('admin/', admin.site.urls),
+    path('metrics', metrics, name='metrics'),
     path('about/', include('django.contrib.flatpages.urls')),
     path('about-us/', views.flatpage, {'url': '/about-us/'}, name='about'),
     path('terms/', views.flatpage, {'url': '/terms/'}, name='terms'),
@@ -20,7 +21,3 @@ urlpatterns = [
 
 handler404 = "posts.views.page_not_found"
 handler500 = "posts.views.server_error"
-
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
-    urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
@@ -11,6 +11,9 @@ import os
 
 from django.core.wsgi import get_wsgi_application
 
+from yatube.serving import StaticFilesMiddleware
+
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
 
-application = get_wsgi_application()
+# files under STATIC_URL and MEDIA_URL never reach Django
+application = StaticFilesMiddleware(get_wsgi_application())